@@ -0,0 +1,61 @@
+"""Board image encoding: time and bytes per frame for each output format.
+
+Renders positions from seeded random games once, then encodes every frame
+with each format and compression level and reports the mean encode time
+and upload size. Use it to pick CHESSBOT_IMAGE_FORMAT and
+CHESSBOT_IMAGE_COMPRESS_LEVEL for a deployment. No Discord connection,
+database or engine is needed.
+
+    python benchmarks/bench_encode.py --frames 200
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+import chess
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import discordchessbot as bot  # noqa: E402
+
+CANDIDATES = [
+    ("png", 1), ("png", 3), ("png", 6), ("png", 9),
+    ("png8", 1), ("png8", 3), ("png8", 6), ("png8", 9),
+    ("webp", 0), ("webp", 2), ("webp", 4),
+]
+
+
+def sample_frames(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    frames = []
+    board = chess.Board()
+    while len(frames) < count:
+        if board.is_game_over() or len(board.move_stack) >= 120:
+            board = chess.Board()
+        board.push(rng.choice(list(board.legal_moves)))
+        frames.append(bot.renderer.render(board, rng.choice(("white", "black"))))
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    frames = sample_frames(args.frames, args.seed)
+    print(f"{'format':8s} {'level':>5s} {'ms/frame':>9s} {'bytes/frame':>12s}")
+    for fmt, level in CANDIDATES:
+        encoder = bot.ImageEncoder(fmt, level)
+        size = 0
+        start = time.perf_counter()
+        for image in frames:
+            size += len(encoder.encode(image))
+        elapsed = time.perf_counter() - start
+        print(f"{fmt:8s} {level:5d} {elapsed / len(frames) * 1000:9.2f} {size // len(frames):12d}")
+
+
+if __name__ == "__main__":
+    main()
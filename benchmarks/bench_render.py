@@ -0,0 +1,86 @@
+"""Full versus incremental board rendering over long games.
+
+Plays seeded random games and renders every position twice: from scratch,
+and by repainting the previous frame. Reports per-frame draw and
+draw+encode times for both, and checks the two images are identical. No
+Discord connection, database or engine is needed.
+
+    python benchmarks/bench_render.py --games 20 --plies 200
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+import chess
+from PIL import ImageChops
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import discordchessbot as bot  # noqa: E402
+
+
+def random_game(rng: random.Random, plies: int) -> list[str]:
+    board = chess.Board()
+    placements = [board.board_fen()]
+    while len(board.move_stack) < plies and not board.is_game_over():
+        board.push(rng.choice(list(board.legal_moves)))
+        placements.append(board.board_fen())
+    return placements
+
+
+def run(games: int, plies: int, seed: int, perspective: str):
+    rng = random.Random(seed)
+    renderer = bot.renderer
+    totals = {"full_draw": 0.0, "full_encode": 0.0, "incr_draw": 0.0, "incr_encode": 0.0}
+    frames = fallbacks = mismatches = 0
+    for _ in range(games):
+        placements = random_game(rng, plies)
+        prev_board = chess.BaseBoard(placements[0])
+        prev_image = renderer.render(prev_board, perspective)
+        for fen in placements[1:]:
+            board = chess.BaseBoard(fen)
+
+            start = time.perf_counter()
+            full = renderer.render(board, perspective)
+            totals["full_draw"] += time.perf_counter() - start
+            start = time.perf_counter()
+            bot.encoder.encode(full)
+            totals["full_encode"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            image = renderer.repaint(prev_image, prev_board, board, perspective)
+            if image is None:
+                fallbacks += 1
+                image = renderer.render(board, perspective)
+            totals["incr_draw"] += time.perf_counter() - start
+            start = time.perf_counter()
+            bot.encoder.encode(image)
+            totals["incr_encode"] += time.perf_counter() - start
+
+            mismatches += ImageChops.difference(full, image).getbbox() is not None
+            prev_board, prev_image = board, image
+            frames += 1
+    return frames, fallbacks, mismatches, totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--plies", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--perspective", choices=("white", "black"), default="white")
+    args = parser.parse_args()
+
+    frames, fallbacks, mismatches, totals = run(args.games, args.plies, args.seed, args.perspective)
+    per_frame = {k: v / frames * 1e6 for k, v in totals.items()}
+    print(f"frames={frames} fallbacks={fallbacks} mismatches={mismatches}")
+    for mode in ("full", "incr"):
+        draw, encode = per_frame[f"{mode}_draw"], per_frame[f"{mode}_encode"]
+        print(f"{mode:4s}: draw {draw:8.1f} us  draw+encode {draw + encode:8.1f} us")
+    print(f"draw speedup x{per_frame['full_draw'] / per_frame['incr_draw']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Swiss pairing benchmark on synthetic fields.
+
+Pairs every round of a simulated Swiss event and reports the time per
+round, plus rematch and colour-balance checks. No Discord connection,
+database or engine is needed.
+
+    python benchmarks/bench_swiss.py --players 10000 --rounds 9
+
+Small fields, where greedy pairing is most likely to be forced into a
+rematch, are also checked over many seeds (skip with --no-small).
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import discordchessbot as bot  # noqa: E402
+
+
+def simulate(n_players: int, rounds: int, seed: int):
+    rng = random.Random(seed)
+    players = {uid: bot.SwissPlayer(uid, rng.gauss(1500, 300)) for uid in range(1, n_players + 1)}
+    timings = []
+    rematches = 0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        pairs, bye = bot.swiss_pair(list(players.values()))
+        timings.append(time.perf_counter() - start)
+        for w, b in pairs:
+            white, black = players[w], players[b]
+            rematches += b in white.opponents
+            # Higher rated side is favoured; about 1 in 5 games is drawn
+            roll = rng.random()
+            p_white = bot.expected_score(white.rating, black.rating)
+            if roll < 0.2:
+                result = '1/2-1/2'
+            elif roll < 0.2 + 0.8 * p_white:
+                result = '1-0'
+            else:
+                result = '0-1'
+            bot.record_swiss_result(white, black, result)
+        if bye is not None:
+            bot.record_swiss_result(players[bye], None, None)
+    worst_balance = max(abs(p.color_balance) for p in players.values())
+    return timings, rematches, worst_balance
+
+
+def small_fields(sizes=(6, 8, 12, 16, 32), rounds: int = 5, seeds: int = 50):
+    for n in sizes:
+        rematches = worst = 0
+        for seed in range(seeds):
+            _, r, w = simulate(n, rounds, seed)
+            rematches += r
+            worst = max(worst, w)
+        print(f"small field players={n} rounds={rounds} seeds={seeds} "
+              f"rematches={rematches} worst_color_balance={worst}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--players", type=int, default=10_000)
+    parser.add_argument("--rounds", type=int, default=9)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-small", action="store_true", help="skip the small-field check")
+    args = parser.parse_args()
+
+    if not args.no_small:
+        small_fields()
+
+    timings, rematches, worst_balance = simulate(args.players, args.rounds, args.seed)
+    for rnd, seconds in enumerate(timings, start=1):
+        print(f"round {rnd:2d}: {seconds * 1000:8.1f} ms")
+    print(f"players={args.players} rounds={args.rounds} "
+          f"max={max(timings) * 1000:.1f} ms mean={sum(timings) / len(timings) * 1000:.1f} ms "
+          f"rematches={rematches} worst_color_balance={worst_balance}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Offline stand-ins for Discord, shared by the benchmark scripts.
+
+``load_bot`` points the bot at a scratch database and imports it with
+Discord lookups patched out, so command callbacks can be awaited directly
+with a ``FakeContext``. Nothing here opens a network connection.
+"""
+import importlib
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.mention = f"<@{user_id}>"
+
+    def __eq__(self, other):
+        return getattr(other, "id", None) == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+
+
+class FakeMessage:
+    def __init__(self, message_id: int):
+        self.id = message_id
+
+    async def add_reaction(self, emoji):
+        pass
+
+
+class FakeContext:
+    """Enough of ``commands.Context`` for the bot's command callbacks.
+
+    Sends are counted and dropped; attachments are still read so encoding
+    and upload preparation stay in the measured path.
+    """
+
+    sends = 0
+
+    def __init__(self, user_id: int, channel_id: int = 1):
+        self.author = FakeUser(user_id)
+        self.channel = FakeChannel(channel_id)
+        self.guild = None
+        self.sent = 0
+
+    async def send(self, content=None, **kwargs):
+        self.sent += 1
+        FakeContext.sends += 1
+        for f in [kwargs.get("file"), *(kwargs.get("files") or ())]:
+            if f is not None:
+                f.fp.read()
+        return FakeMessage(FakeContext.sends)
+
+    send_now = send
+
+
+def load_bot(db_path: str, **env):
+    """Import discordchessbot against ``db_path`` with Discord lookups faked."""
+    os.environ["CHESSBOT_DB"] = db_path
+    os.environ.update({k: str(v) for k, v in env.items()})
+    bot = importlib.import_module("discordchessbot")
+    users = {}
+    bot.bot.get_user = lambda user_id: users.setdefault(user_id, FakeUser(user_id))
+
+    async def wait_for(*args, **kwargs):
+        # Every challenge is accepted at once
+        return None, None
+    bot.bot.wait_for = wait_for
+    return bot
+
+
+def summarize(samples) -> dict:
+    """Latency summary in milliseconds for a list of durations in seconds."""
+    if not samples:
+        return {"n": 0}
+    ordered = sorted(samples)
+    n = len(ordered)
+    return {
+        "n": n,
+        "mean_ms": sum(ordered) / n * 1000,
+        "p50_ms": ordered[n // 2] * 1000,
+        "p99_ms": ordered[min(n - 1, int(n * 0.99))] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
@@ -0,0 +1,267 @@
+"""Offline load test: thousands of simulated games against one bot process.
+
+Drives the real command callbacks (``challenge``, ``make_move``,
+``ai_move``, ``resign``, ``tournament_*``) through the fake Discord layer
+in ``harness``. Every simulated player thinks for an exponentially
+distributed time between moves. Reports command latency percentiles,
+event-loop lag, engine queue depth and time spent in the database, which
+is how to find one process's capacity before a big server event.
+
+    python benchmarks/loadtest.py --games 2000 --move-rate 0.5 --duration 60
+    STOCKFISH_PATH=/usr/bin/stockfish python benchmarks/loadtest.py --ai-games 50
+    python benchmarks/loadtest.py --games 0 --tournament-players 256
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+from harness import FakeContext, FakeUser, load_bot, summarize
+
+
+class Stats:
+    def __init__(self):
+        self.latency = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.loop_lag = []
+        self.engine_queue = []
+        self.search_scale = []
+        self.db_exec = []
+        self.db_wait = []
+        self.games_finished = 0
+
+    async def timed(self, name, coro):
+        start = time.perf_counter()
+        try:
+            return await coro
+        except Exception as e:
+            self.errors[f"{name}: {type(e).__name__}"] += 1
+        finally:
+            self.latency[name].append(time.perf_counter() - start)
+
+
+def instrument_db(bot, stats: Stats):
+    """Time every database call: on its thread, and as awaited by handlers."""
+    db = bot.db
+
+    def on_thread(run):
+        def wrapper(fn, args):
+            start = time.perf_counter()
+            try:
+                return run(fn, args)
+            finally:
+                stats.db_exec.append(time.perf_counter() - start)
+        return wrapper
+
+    def awaited(call):
+        async def wrapper(fn, *args):
+            start = time.perf_counter()
+            try:
+                return await call(fn, *args)
+            finally:
+                stats.db_wait.append(time.perf_counter() - start)
+        return wrapper
+
+    db._run_write = on_thread(db._run_write)
+    db._run_read = on_thread(db._run_read)
+    db.write = awaited(db.write)
+    db.read = awaited(db.read)
+
+
+async def monitor(bot, stats: Stats, stop: asyncio.Event, interval: float = 0.05):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        stats.loop_lag.append(max(0.0, loop.time() - start - interval))
+        stats.engine_queue.append(bot.engine_pool.queue_depth)
+        stats.search_scale.append(bot.search_controller.scale)
+
+
+async def think(rng: random.Random, rate: float):
+    await asyncio.sleep(rng.expovariate(rate) if rate > 0 else 0)
+
+
+async def play_head_to_head(bot, stats, rng, white, black, rate, plies):
+    """Alternate random legal moves until mate, a draw or ``plies``; then Black resigns."""
+    contexts = {white: FakeContext(white, channel_id=white), black: FakeContext(black, channel_id=white)}
+    for _ in range(plies):
+        game = await bot.games.fetch(white)
+        if game is None or game['board'].is_game_over():
+            break
+        await think(rng, rate)
+        mover = game['turn']
+        move = rng.choice(list(game['board'].legal_moves)).uci()
+        await stats.timed("move", bot.make_move.callback(contexts[mover], move))
+    if black in bot.games:
+        await stats.timed("resign", bot.resign.callback(contexts[black]))
+    stats.games_finished += 1
+
+
+async def head_to_head_slot(bot, stats, slot, args, deadline):
+    rng = random.Random(args.seed * 100_003 + slot)
+    white, black = 1_000_000 + 2 * slot, 1_000_001 + 2 * slot
+    await asyncio.sleep(rng.uniform(0, args.ramp))
+    while time.monotonic() < deadline:
+        await stats.timed("challenge", bot.challenge.callback(FakeContext(white, channel_id=white), FakeUser(black)))
+        await play_head_to_head(bot, stats, rng, white, black, args.move_rate, args.plies)
+
+
+async def ai_slot(bot, stats, slot, args, deadline):
+    rng = random.Random(args.seed * 200_003 + slot)
+    ctx = FakeContext(2_000_000 + slot, channel_id=2_000_000 + slot)
+    await asyncio.sleep(rng.uniform(0, args.ramp))
+    while time.monotonic() < deadline:
+        await stats.timed("start_ai", bot.cmd_start_ai.callback(ctx))
+        session = bot.sessions.get(bot._session_key(ctx))
+        for _ in range(args.plies // 2):
+            if session is None or session.board.is_game_over() or time.monotonic() >= deadline:
+                break
+            await think(rng, args.move_rate)
+            if session.board.turn != session.player_color:
+                # Difficulty prompt is never answered; ask for the engine's move directly
+                await stats.timed("ai", bot.ai_move(ctx))
+                continue
+            move = rng.choice(list(session.board.legal_moves)).uci()
+            # Includes the engine's reply
+            await stats.timed("move", bot.make_move.callback(ctx, move))
+        await stats.timed("exit", bot.exit_game.callback(ctx))
+        stats.games_finished += 1
+
+
+async def tournament_run(bot, stats, args):
+    rng = random.Random(args.seed)
+    host = FakeContext(3_000_000)
+    await stats.timed("tournament_create", bot.tournament_create.callback(host, name="load"))
+    t_id = (await bot.db.fetchone("SELECT MAX(id) FROM tournaments"))[0]
+    players = [3_000_001 + i for i in range(args.tournament_players)]
+    await asyncio.gather(*(stats.timed("tournament_join", bot.tournament_join.callback(FakeContext(p), t_id))
+                           for p in players))
+    await stats.timed("tournament_start", bot.tournament_start.callback(host, t_id))
+    while True:
+        matches = {id(g): g for g in bot.games.values() if g.get('tournament_id') == t_id}
+        if not matches:
+            break
+        await asyncio.gather(*(play_head_to_head(bot, stats, rng, g['white'], g['black'], args.move_rate, args.plies)
+                               for g in matches.values()))
+    await stats.timed("tournament_bracket", bot.tournament_bracket.callback(host, t_id))
+
+
+async def run(bot, args):
+    stats = Stats()
+    instrument_db(bot, stats)
+    await bot.init_db()
+    bot.restore_games(bot.journal.open())
+    bot.journal.start_task()
+    if args.max_resident is not None:
+        bot.games.max_games, bot.games.idle_seconds = args.max_resident, args.idle
+    bot.games.start()
+    bot.recorder.start()
+    if args.ai_games:
+        await bot.engine_pool.start()
+        bot.search_controller.start()
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(monitor(bot, stats, stop))
+    deadline = time.monotonic() + args.duration
+    start = time.perf_counter()
+    tasks = [head_to_head_slot(bot, stats, i, args, deadline) for i in range(args.games)]
+    tasks += [ai_slot(bot, stats, i, args, deadline) for i in range(args.ai_games)]
+    if args.tournament_players:
+        tasks.append(tournament_run(bot, stats, args))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await watcher
+    bot.games.stop()
+    await bot.recorder.close()
+    await bot.journal.close()
+    if args.ai_games:
+        bot.search_controller.stop()
+        await bot.engine_pool.close()
+    bot.render_pool.shutdown()
+    commands = sum(len(v) for v in stats.latency.values())
+    queue = stats.engine_queue
+    return {
+        "config": vars(args),
+        "elapsed_s": elapsed,
+        "games_finished": stats.games_finished,
+        "commands": commands,
+        "commands_per_s": commands / elapsed if elapsed else 0.0,
+        "latency": {name: summarize(samples) for name, samples in sorted(stats.latency.items())},
+        "errors": dict(stats.errors),
+        "loop_lag": summarize(stats.loop_lag),
+        "engine_queue_depth": {"max": max(queue, default=0), "mean": sum(queue) / len(queue) if queue else 0.0},
+        "search_scale": {"min": min(stats.search_scale, default=1.0),
+                         "mean": sum(stats.search_scale) / len(stats.search_scale) if stats.search_scale else 1.0},
+        "db": {
+            "calls": len(stats.db_exec),
+            "exec": summarize(stats.db_exec),
+            "awaited": summarize(stats.db_wait),
+            "exec_total_s": sum(stats.db_exec),
+        },
+        "image_cache": bot.image_cache.stats(),
+        "game_store": bot.games.stats(),
+    }
+
+
+def print_report(report):
+    print(f"{report['games_finished']} games, {report['commands']} commands in {report['elapsed_s']:.1f} s "
+          f"({report['commands_per_s']:.0f}/s)")
+    print(f"{'command':20s} {'n':>7s} {'p50 ms':>9s} {'p99 ms':>9s} {'max ms':>9s}")
+    for name, s in report["latency"].items():
+        print(f"{name:20s} {s['n']:7d} {s['p50_ms']:9.2f} {s['p99_ms']:9.2f} {s['max_ms']:9.2f}")
+    lag = report["loop_lag"]
+    if lag["n"]:
+        print(f"loop lag: p50 {lag['p50_ms']:.2f} ms  p99 {lag['p99_ms']:.2f} ms  max {lag['max_ms']:.2f} ms")
+    q = report["engine_queue_depth"]
+    print(f"engine queue depth: max {q['max']}  mean {q['mean']:.2f}")
+    scale = report["search_scale"]
+    print(f"search budget scale: min {scale['min']:.2f}  mean {scale['mean']:.2f}")
+    db = report["db"]
+    if db["calls"]:
+        print(f"db: {db['calls']} calls, {db['exec_total_s']:.2f} s on DB threads, "
+              f"exec p99 {db['exec']['p99_ms']:.2f} ms, awaited p99 {db['awaited']['p99_ms']:.2f} ms")
+    store = report["game_store"]
+    print(f"games at exit: {store['resident']} resident, {store['parked']} parked")
+    for name, count in report["errors"].items():
+        print(f"error {name}: {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--games", type=int, default=1000, help="concurrent 1v1 games")
+    parser.add_argument("--ai-games", type=int, default=0, help="concurrent AI games (needs Stockfish)")
+    parser.add_argument("--tournament-players", type=int, default=0, help="also run one bracket of this size")
+    parser.add_argument("--move-rate", type=float, default=0.5, help="moves per second per player")
+    parser.add_argument("--plies", type=int, default=60, help="moves before a game is resigned")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to keep starting games")
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which games are started")
+    parser.add_argument("--max-resident", type=int, help="cap on 1v1 games kept in memory (default: the bot's)")
+    parser.add_argument("--idle", type=float, default=1.0, help="seconds idle before a game over the cap is parked")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the report as JSON here")
+    args = parser.parse_args()
+
+    if args.ai_games and shutil.which(os.getenv("STOCKFISH_PATH", "stockfish")) is None:
+        parser.error("--ai-games needs Stockfish; set STOCKFISH_PATH")
+    with tempfile.TemporaryDirectory() as tmp:
+        bot = load_bot(os.path.join(tmp, "load.db"))
+        try:
+            report = asyncio.run(run(bot, args))
+        finally:
+            bot.db.close()
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if not report["errors"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,290 @@
+"""Benchmark suite for the bot's hot paths, with JSON output.
+
+Runs against a scratch SQLite file in a temporary directory and, when one
+is found, the Stockfish binary named by STOCKFISH_PATH. Benchmarks that
+need the engine are skipped without it. No Discord connection is made:
+commands are driven through ``harness.FakeContext``.
+
+    python benchmarks/suite.py --output results.json
+    python benchmarks/suite.py --quick
+
+The bot's own log lines go to stderr, so stdout carries only the report.
+Compare two result files between releases to catch regressions; every
+timing is reported in milliseconds.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import chess
+
+from harness import FakeContext, FakeUser, load_bot, summarize
+
+SIZES = {
+    "full": {"renders": 200, "finalize": 500, "recorder": 5000, "players": 100_000,
+             "bracket": 1024, "games": 20, "plies": 80, "ai_moves": 20, "journal_games": 10_000},
+    "quick": {"renders": 40, "finalize": 100, "recorder": 1000, "players": 10_000,
+              "bracket": 128, "games": 4, "plies": 40, "ai_moves": 5, "journal_games": 1000},
+}
+
+
+def random_games(count: int, plies: int, seed: int) -> list[list[str]]:
+    rng = random.Random(seed)
+    games = []
+    for _ in range(count):
+        board = chess.Board()
+        while len(board.move_stack) < plies and not board.is_game_over():
+            board.push(rng.choice(list(board.legal_moves)))
+        games.append([m.uci() for m in board.move_stack])
+    return games
+
+
+def bench_render(bot, size):
+    boards = []
+    for moves in random_games(size["renders"] // 40 + 1, 40, seed=2):
+        board = chess.Board()
+        for uci in moves:
+            board.push_uci(uci)
+            boards.append(board.copy(stack=False))
+    samples = []
+    for board in boards[:size["renders"]]:
+        start = time.perf_counter()
+        bot.generate_board_image(board, "white")
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+async def bench_finalize_game(bot, size):
+    rng = random.Random(3)
+    board = chess.Board()
+    for uci in random_games(1, 60, seed=3)[0]:
+        board.push_uci(uci)
+    samples = []
+    for _ in range(size["finalize"]):
+        white, black = rng.sample(range(1, 1001), 2)
+        start = time.perf_counter()
+        await bot.finalize_game(white, black, rng.choice(("1-0", "0-1", "1/2-1/2")), board)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+async def bench_recorder(bot, size):
+    rng = random.Random(4)
+    board = chess.Board()
+    for uci in random_games(1, 60, seed=4)[0]:
+        board.push_uci(uci)
+    recorder = bot.GameRecorder(batch_size=64, flush_interval=0.05)
+    recorder.start()
+    start = time.perf_counter()
+    for _ in range(size["recorder"]):
+        white, black = rng.sample(range(1, 1001), 2)
+        recorder.submit(white, black, "1-0", board)
+    submitted = time.perf_counter() - start
+    await recorder.close()
+    total = time.perf_counter() - start
+    return {"games": size["recorder"], "submit_ms": submitted * 1000, "drain_ms": total * 1000,
+            "games_per_s": size["recorder"] / total}
+
+
+async def bench_leaderboard(bot, size):
+    rng = random.Random(5)
+    rows = [(10_000 + i, rng.gauss(1200, 200)) for i in range(size["players"])]
+    await bot.db.write(lambda conn: conn.executemany(
+        "INSERT OR REPLACE INTO players(user_id, rating) VALUES (?, ?)", rows))
+    board = bot.leaderboard
+    board._ratings = None
+    board._top = None
+    start = time.perf_counter()
+    await board.display_leaderboard(rows[0][0])
+    cold = time.perf_counter() - start
+    samples = []
+    for uid, _ in rng.sample(rows, 200):
+        start = time.perf_counter()
+        await board.display_leaderboard(uid)
+        samples.append(time.perf_counter() - start)
+    after_game = []
+    for _ in range(50):
+        # A finished game invalidates the cached top rows
+        uid, _ = rng.choice(rows)
+        board.apply_ratings([(uid, rng.gauss(1200, 200))])
+        start = time.perf_counter()
+        await board.display_leaderboard(uid)
+        after_game.append(time.perf_counter() - start)
+    return {"players": size["players"], "cold_ms": cold * 1000,
+            "warm": summarize(samples), "after_rating_change": summarize(after_game)}
+
+
+async def bench_tournament(bot, size):
+    ctx = FakeContext(1)
+    await bot.tournament_create.callback(ctx, name="bench")
+    t_id = (await bot.db.fetchone("SELECT MAX(id) FROM tournaments"))[0]
+    players = [(t_id, 500_000 + i) for i in range(size["bracket"])]
+    await bot.db.write(lambda conn: conn.executemany(
+        "INSERT INTO tournament_players(tournament_id, user_id) VALUES (?, ?)", players))
+    start = time.perf_counter()
+    await bot.tournament_start.callback(ctx, t_id)
+    start_ms = (time.perf_counter() - start) * 1000
+    rounds = []
+    while True:
+        pending = {id(g): g for g in bot.games.values() if g.get("tournament_id") == t_id}
+        if not pending:
+            break
+        samples = []
+        round_start = time.perf_counter()
+        for game in pending.values():
+            # Black resigns: the full command path, including round advancement
+            start = time.perf_counter()
+            await bot.resign.callback(FakeContext(game["black"]))
+            samples.append(time.perf_counter() - start)
+        rounds.append({"matches": len(samples), "total_ms": (time.perf_counter() - round_start) * 1000,
+                       "per_match": summarize(samples)})
+    return {"players": size["bracket"], "start_ms": start_ms, "rounds": rounds}
+
+
+async def bench_make_move(bot, size):
+    samples = []
+    for n, moves in enumerate(random_games(size["games"], size["plies"], seed=6)):
+        white, black = 900_000 + 2 * n, 900_001 + 2 * n
+        contexts = {white: FakeContext(white, channel_id=n), black: FakeContext(black, channel_id=n)}
+        await bot.challenge.callback(contexts[white], FakeUser(black))
+        for ply, uci in enumerate(moves):
+            ctx = contexts[white if ply % 2 == 0 else black]
+            start = time.perf_counter()
+            await bot.make_move.callback(ctx, uci)
+            samples.append(time.perf_counter() - start)
+        await bot.exit_game.callback(contexts[white])
+    return summarize(samples)
+
+
+async def bench_ai_move(bot, size):
+    await bot.engine_pool.start()
+    try:
+        ctx = FakeContext(990_000, channel_id=990_000)
+        await bot.start_solo_game(ctx)
+        session = bot.sessions[bot._session_key(ctx)]
+        session.mode = "ai"
+        samples = []
+        rng = random.Random(7)
+        for _ in range(size["ai_moves"]):
+            if session.board.is_game_over():
+                break
+            # Player move, then the engine's reply through the pool
+            move = rng.choice(list(session.board.legal_moves)).uci()
+            start = time.perf_counter()
+            await bot.make_move.callback(ctx, move)
+            await bot.ai_move(ctx)
+            samples.append(time.perf_counter() - start)
+        return summarize(samples)
+    finally:
+        await bot.engine_pool.close()
+
+
+async def bench_journal(bot, size, directory):
+    """Journal every move of many open games, then time a restart."""
+    path = os.path.join(directory, "bench.journal")
+    journal = bot.GameJournal(path)
+    journal.open()
+    games = [[chess.Move.from_uci(uci) for uci in moves] for moves in random_games(50, 80, seed=8)]
+    start = time.perf_counter()
+    for n in range(size["journal_games"]):
+        gid = journal.start({"mode": "1v1", "white": 2 * n, "black": 2 * n + 1})
+        for move in games[n % len(games)]:
+            journal.move(gid, move)
+    appended = time.perf_counter() - start
+    await journal.close()
+    results = {"games": size["journal_games"], "append_ms": appended * 1000}
+    for phase in ("replay", "snapshot"):
+        journal = bot.GameJournal(path)
+        start = time.perf_counter()
+        live = journal.open()
+        results[f"open_{phase}_ms"] = (time.perf_counter() - start) * 1000
+        results[f"{phase}_bytes"] = os.path.getsize(path)
+        if phase == "replay":
+            await journal.compact()
+        await journal.close()
+    # Restored boards are only replayed when touched
+    start = time.perf_counter()
+    bot.restore_games(live)
+    results["restore_ms"] = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    bot.games[0]["board"]
+    results["first_touch_ms"] = (time.perf_counter() - start) * 1000
+    bot.games.clear()
+    return results
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(bot, size, engine: bool, directory: str):
+    await bot.init_db()
+    bot.recorder.start()
+    results, skipped = {}, {}
+    results["generate_board_image"] = bench_render(bot, size)
+    results["finalize_game"] = await bench_finalize_game(bot, size)
+    results["game_recorder"] = await bench_recorder(bot, size)
+    results["leaderboard"] = await bench_leaderboard(bot, size)
+    results["tournament_advance"] = await bench_tournament(bot, size)
+    results["make_move_1v1"] = await bench_make_move(bot, size)
+    if engine:
+        results["make_move_ai"] = await bench_ai_move(bot, size)
+    else:
+        skipped["make_move_ai"] = "Stockfish not found (set STOCKFISH_PATH)"
+    results["journal"] = await bench_journal(bot, size, directory)
+    await bot.recorder.close()
+    bot.render_pool.shutdown()
+    return results, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes, for a smoke run")
+    args = parser.parse_args()
+
+    size = SIZES["quick" if args.quick else "full"]
+    stockfish = os.getenv("STOCKFISH_PATH", "stockfish")
+    engine = shutil.which(stockfish) is not None
+    # The bot logs with print(); keep stdout for the JSON report alone
+    with contextlib.redirect_stdout(sys.stderr), tempfile.TemporaryDirectory() as tmp:
+        bot = load_bot(os.path.join(tmp, "bench.db"))
+        try:
+            results, skipped = asyncio.run(run(bot, size, engine, tmp))
+        finally:
+            bot.db.close()
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "stockfish": stockfish if engine else None,
+            "sizes": size,
+        },
+        "results": results,
+        "skipped": skipped,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
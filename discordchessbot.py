@@ -5,18 +5,26 @@ import chess
 import chess.svg
 import chess.engine
 from PIL import Image, ImageDraw, ImageFont
-from io import BytesIO
+from io import BytesIO, StringIO
 import random
 import asyncio
-from stockfish import Stockfish
 from threading import Thread
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import time
 import threading
 import sqlite3
+import sys
+import traceback
 import math
+import bisect
+import json
+import struct
+import itertools
 import datetime
 import chess.pgn
 
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from pathlib import Path
 
 # Try to load .env if present (optional dependency)
@@ -28,14 +36,652 @@ except Exception:
 
 intents = discord.Intents.default()
 intents.message_content = True
-bot = commands.Bot(command_prefix=commands.when_mentioned_or("/", "!", "."),
-                   intents=intents)
+class ChessBot(commands.Bot):
+    async def get_context(self, origin, /, *, cls=None):
+        return await super().get_context(origin, cls=cls or OutboxContext)
+
+    async def setup_hook(self):
+        # Runs once per process, not on every reconnect
+        await init_db()
+        # Before the gateway connects, so no command sees a half-restored table
+        await games.load_index()
+        restore_games(await asyncio.to_thread(journal.open))
+        journal.start_task()
+        games.start()
+        self.migration_task = asyncio.create_task(migrate_pgn_games())
+        self.migration_task.add_done_callback(_report_migration)
+        await engine_pool.start()
+        recorder.start()
+        search_controller.start()
+        watchdog.start(self)
+        self.metrics_tasks = []
+        if METRICS_FILE:
+            self.metrics_tasks.append(asyncio.create_task(metrics.dump_to_file(METRICS_FILE, METRICS_INTERVAL)))
+        if METRICS_PORT:
+            self.metrics_server = await metrics.serve(METRICS_PORT)
+
+    async def close(self):
+        watchdog.stop()
+        search_controller.stop()
+        games.stop()
+        if getattr(self, 'migration_task', None) is not None:
+            self.migration_task.cancel()
+        for task in getattr(self, 'metrics_tasks', ()):
+            task.cancel()
+        if getattr(self, 'metrics_server', None) is not None:
+            self.metrics_server.close()
+        await engine_pool.close()
+        render_pool.shutdown()
+        await super().close()
+        await recorder.close()
+        await journal.close()
+        db.close()
+
+bot = ChessBot(command_prefix=commands.when_mentioned_or("/", "!", "."),
+               intents=intents)
 
 TOKEN = os.getenv('DISCORD_BOT_TOKEN')
 
+###########
+# Metrics #
+###########
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Histogram:
+    """Latency histogram with fixed buckets, one series per label value."""
+
+    def __init__(self, name: str, help_text: str, label: str | None = None, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.buckets = buckets
+        # label value -> [count per bucket..., +Inf count, sum]
+        self.series = {}
+
+    def observe(self, value, seconds: float):
+        row = self.series.get(value)
+        if row is None:
+            row = self.series[value] = [0] * (len(self.buckets) + 1) + [0.0]
+        row[bisect.bisect_left(self.buckets, seconds)] += 1
+        row[-1] += seconds
+
+    @contextmanager
+    def time(self, value=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(value, time.perf_counter() - start)
+
+    def summary(self, value) -> tuple[int, float, float, float]:
+        """Return ``(count, mean, p50, p99)``; quantiles are bucket upper bounds."""
+        row = self.series[value]
+        count = sum(row[:-1])
+        if not count:
+            return 0, 0.0, 0.0, 0.0
+        bounds = self.buckets + (math.inf,)
+
+        def quantile(q):
+            running = 0
+            for bound, n in zip(bounds, row):
+                running += n
+                if running >= q * count:
+                    return bound
+            return math.inf
+        return count, row[-1] / count, quantile(0.5), quantile(0.99)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for value, row in sorted(self.series.items(), key=lambda kv: str(kv[0])):
+            labels = f'{self.label}="{value}",' if self.label else ""
+            running = 0
+            for bound, n in zip(self.buckets + ("+Inf",), row):
+                running += n
+                lines.append(f'{self.name}_bucket{{{labels}le="{bound}"}} {running}')
+            labels = labels.rstrip(",")
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {row[-1]}")
+            lines.append(f"{self.name}_count{suffix} {running}")
+        return lines
+
+class Metrics:
+    """In-process timings and gauges, with no external service.
+
+    Histograms are filled by the code they time; gauges are read on demand.
+    ``prometheus`` renders the text exposition format for a scrape endpoint
+    or file dump, and ``report`` the short summary shown by ``!botstats``.
+    """
+
+    def __init__(self):
+        self.histograms = []
+        self.gauges = []
+
+    def histogram(self, name: str, help_text: str, label: str | None = None) -> Histogram:
+        hist = Histogram(name, help_text, label)
+        self.histograms.append(hist)
+        return hist
+
+    def gauge(self, name: str, help_text: str, read):
+        self.gauges.append((name, help_text, read))
+
+    def _gauge_values(self):
+        for name, help_text, read in self.gauges:
+            try:
+                yield name, help_text, float(read())
+            except Exception:
+                continue
+
+    def prometheus(self) -> str:
+        lines = []
+        for hist in self.histograms:
+            lines.extend(hist.render())
+        for name, help_text, value in self._gauge_values():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def report(self) -> str:
+        lines = [f"{'timer':34s} {'n':>7s} {'mean':>8s} {'p50<=':>7s} {'p99<=':>7s}"]
+        for hist in self.histograms:
+            for value in sorted(hist.series, key=str):
+                count, mean, p50, p99 = hist.summary(value)
+                name = hist.name.removeprefix("chessbot_").removesuffix("_seconds")
+                label = f"{name}[{value}]" if value is not None else name
+                lines.append(f"{label:34s} {count:7d} {mean * 1000:6.1f}ms {_fmt_bound(p50):>7s} {_fmt_bound(p99):>7s}")
+        for name, _, value in self._gauge_values():
+            lines.append(f"{name.removeprefix('chessbot_'):34s} {value:g}")
+        return "\n".join(lines)
+
+    async def dump_to_file(self, path: str, interval: float):
+        # Write to a temporary file and rename, so readers never see a partial dump
+        while True:
+            tmp = f"{path}.tmp"
+            try:
+                await asyncio.to_thread(Path(tmp).write_text, self.prometheus())
+                os.replace(tmp, path)
+            except OSError as e:
+                print(f"Failed to write metrics to {path}: {e}")
+            await asyncio.sleep(interval)
+
+    async def serve(self, port: int, host: str = "127.0.0.1"):
+        """Serve the Prometheus text on ``http://host:port/metrics``."""
+        async def handle(reader, writer):
+            try:
+                request = await reader.readline()
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                if request.split(b" ")[1:2] == [b"/metrics"]:
+                    body, status = self.prometheus().encode(), "200 OK"
+                else:
+                    body, status = b"Not found\n", "404 Not Found"
+                writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                             f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+                await writer.drain()
+            except (ConnectionError, IndexError):
+                pass
+            finally:
+                writer.close()
+        return await asyncio.start_server(handle, host, port)
+
+# Optional Prometheus exports: a local scrape endpoint and/or a text file
+METRICS_PORT = int(os.getenv("CHESSBOT_METRICS_PORT", "0"))
+METRICS_FILE = os.getenv("CHESSBOT_METRICS_FILE")
+METRICS_INTERVAL = float(os.getenv("CHESSBOT_METRICS_INTERVAL", "15"))
+
+def _fmt_bound(seconds: float) -> str:
+    return ">10s" if seconds == math.inf else f"{seconds * 1000:g}ms"
+
+metrics = Metrics()
+COMMAND_SECONDS = metrics.histogram("chessbot_command_seconds", "Command latency, including sending the reply.", "command")
+RENDER_SECONDS = metrics.histogram("chessbot_render_seconds", "Board render and encode time, excluding cache hits.", "mode")
+ENGINE_WAIT_SECONDS = metrics.histogram("chessbot_engine_wait_seconds", "Time spent waiting for an idle engine.", "priority")
+ENGINE_SEARCH_SECONDS = metrics.histogram("chessbot_engine_search_seconds", "Engine search time.", "priority")
+DB_SECONDS = metrics.histogram("chessbot_db_seconds", "Database call time, as awaited by handlers.", "kind")
+SEND_SECONDS = metrics.histogram("chessbot_discord_send_seconds", "Discord API time per sent message.")
+LOOP_LAG_SECONDS = metrics.histogram("chessbot_loop_lag_seconds", "How late the event loop ran a timer.")
+metrics.gauge("chessbot_games_resident", "1v1/tournament games held in memory.", lambda: games.stats()['resident'])
+metrics.gauge("chessbot_games_parked", "Idle 1v1/tournament games parked in the database.", lambda: games.stats()['parked'])
+metrics.gauge("chessbot_sessions", "Solo and AI game sessions.", lambda: len(sessions))
+metrics.gauge("chessbot_journal_live_games", "Games in progress recorded in the journal.", lambda: journal.live)
+metrics.gauge("chessbot_engine_queue_depth", "Requests waiting for an engine.", lambda: engine_pool.queue_depth)
+metrics.gauge("chessbot_search_scale", "Current engine search budget scale (1 = full budgets).", lambda: search_controller.scale)
+metrics.gauge("chessbot_recorder_pending", "Finished games waiting to be written.", lambda: recorder.pending)
+metrics.gauge("chessbot_render_frames", "Games holding a frame image for incremental rendering.", lambda: render_pool.frames)
+metrics.gauge("chessbot_image_cache_bytes", "Bytes of encoded board images cached.", lambda: image_cache.size)
+metrics.gauge("chessbot_image_cache_hit_ratio", "Board image cache hit ratio.", lambda: image_cache.stats()['hit_rate'])
+metrics.gauge("chessbot_move_cache_hit_ratio", "Engine move cache hit ratio.", lambda: move_cache.stats()['hit_rate'])
+
+class StallWatchdog:
+    """Detects event-loop stalls and names the code that caused them.
+
+    A heartbeat task stamps the time every ``interval`` seconds and records
+    loop lag. A watcher thread checks the stamp; once the loop has not run
+    for ``threshold`` seconds, it captures the loop thread's stack while the
+    blocking call is still on it and names the command whose callback is
+    in that stack. When the loop resumes, the stall is reported to the log
+    file or stdout and, if configured, a channel. Reports for the same
+    command and location are rate-limited to one per ``report_interval``.
+    """
+
+    def __init__(self, threshold: float = 0.25, interval: float = 0.05, log_path: str | None = None,
+                 channel_id: int | None = None, report_interval: float = 60.0):
+        self.threshold = threshold
+        self.interval = interval
+        self.log_path = log_path
+        self.channel_id = channel_id
+        self.report_interval = report_interval
+        self.stalls = 0
+        self._beat = time.monotonic()
+        self._loop = None
+        self._loop_thread = None
+        self._commands = {}
+        self._last_report = {}
+        self._suppressed = {}
+        self._stop = threading.Event()
+        self._task = None
+        self._thread = None
+
+    def start(self, client: commands.Bot):
+        if self.threshold <= 0 or self._thread is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._commands = {cmd.callback.__code__: cmd.qualified_name for cmd in client.walk_commands()}
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="stall-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._thread = None
+
+    async def _heartbeat(self):
+        while True:
+            start = time.monotonic()
+            self._beat = start
+            await asyncio.sleep(self.interval)
+            LOOP_LAG_SECONDS.observe(None, max(0.0, time.monotonic() - start - self.interval))
+
+    def _capture(self):
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return None, None, []
+        stack = traceback.extract_stack(frame)
+        command = None
+        while frame is not None and command is None:
+            command = self._commands.get(frame.f_code)
+            frame = frame.f_back
+        # Innermost frame from this file, else whatever is on top
+        here = [f for f in stack if f.filename == __file__]
+        where = (here or stack)[-1]
+        return command, f"{Path(where.filename).name}:{where.lineno} in {where.name}", traceback.format_list(stack)
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            beat = self._beat
+            if time.monotonic() - beat < self.threshold:
+                continue
+            command, where, stack = self._capture()
+            # Wait for the loop to run again to learn how long it was blocked
+            while self._beat == beat and not self._stop.wait(self.interval / 5):
+                pass
+            self._report(time.monotonic() - beat, command, where, stack)
+
+    def _report(self, blocked: float, command, where, stack):
+        self.stalls += 1
+        key = (command, where)
+        now = time.monotonic()
+        if now - self._last_report.get(key, -math.inf) < self.report_interval:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return
+        self._last_report[key] = now
+        suppressed = self._suppressed.pop(key, 0)
+        name = f"!{command}" if command else "no command"
+        summary = f"Event loop blocked for {blocked * 1000:.0f} ms in {name} at {where}"
+        if suppressed:
+            summary += f" ({suppressed} similar stalls not reported)"
+        trace = "".join(stack)
+        stamp = datetime.datetime.utcnow().isoformat(timespec='seconds')
+        if self.log_path:
+            try:
+                with open(self.log_path, "a") as f:
+                    f.write(f"{stamp} {summary}\n{trace}\n")
+            except OSError as e:
+                print(f"Failed to write stall report to {self.log_path}: {e}")
+        else:
+            print(f"{stamp} {summary}")
+        if self.channel_id and self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._post(summary, trace), self._loop)
+
+    async def _post(self, summary: str, trace: str):
+        channel = bot.get_channel(self.channel_id)
+        if channel is None:
+            return
+        # Keep the end of the stack, where the blocking call is
+        tail = trace[-(MESSAGE_LIMIT - len(summary) - 16):]
+        try:
+            await outbox.call(channel.id, channel.send, f"{summary}\n```\n{tail}\n```")
+        except discord.HTTPException as e:
+            print(f"Failed to post stall report: {e}")
+
+watchdog = StallWatchdog(
+    threshold=float(os.getenv("CHESSBOT_STALL_THRESHOLD_MS", "250")) / 1000,
+    log_path=os.getenv("CHESSBOT_STALL_LOG") or None,
+    channel_id=int(os.getenv("CHESSBOT_STALL_CHANNEL", "0")) or None,
+    report_interval=float(os.getenv("CHESSBOT_STALL_REPORT_SECONDS", "60")),
+)
+
 # Configure Stockfish path via env; fallback to system PATH
 STOCKFISH_PATH = os.getenv("STOCKFISH_PATH", "stockfish")
-stockfish = Stockfish(STOCKFISH_PATH)
+
+# Matches the search depth the stockfish wrapper package used by default
+DEFAULT_ENGINE_LIMIT = chess.engine.Limit(depth=15)
+
+# Engine request priorities; background work only runs when no foreground request waits
+FOREGROUND = 0
+BACKGROUND = 1
+
+class EnginePool:
+    """A fixed set of UCI engine processes shared by every game.
+
+    Callers queue FIFO for the next idle engine, so searches from different
+    guilds run in parallel across cores and no game can jump the line.
+    Foreground requests are always served before background ones, and
+    background work may hold at most ``size - 1`` engines so one stays free
+    for players; a single-engine pool runs no background work. Skill is
+    applied per request, and an engine that dies mid-search is restarted
+    and the request retried once.
+    """
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        # A search can't be preempted, so never give background work the last engine
+        self.max_background = size - 1
+        self._engines = [None] * size
+        self._skills = [None] * size
+        self._idle = []
+        self._waiters = (deque(), deque())
+        self._background = 0
+        self._settling = set()
+        self.started = False
+
+    async def _spawn(self):
+        _, engine = await chess.engine.popen_uci(self.path)
+        return engine
+
+    async def start(self):
+        if self.started:
+            return
+        for slot in range(self.size):
+            self._engines[slot] = await self._spawn()
+            self._idle.append(slot)
+        self.started = True
+        self._dispatch()
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for q in self._waiters for fut in q if not fut.done())
+
+    @property
+    def foreground_depth(self) -> int:
+        """Player requests waiting for an engine; pondering is not counted."""
+        return sum(1 for fut in self._waiters[FOREGROUND] if not fut.done())
+
+    def _dispatch(self):
+        # Hand idle engines to waiters, foreground first
+        fg, bg = self._waiters
+        while self._idle:
+            while fg and fg[0].done():
+                fg.popleft()
+            while bg and bg[0].done():
+                bg.popleft()
+            if fg:
+                fg.popleft().set_result(self._idle.pop())
+            elif bg and self._background < self.max_background:
+                self._background += 1
+                bg.popleft().set_result(self._idle.pop())
+            else:
+                break
+
+    async def _acquire(self, priority: int) -> int:
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(fut)
+        self._dispatch()
+        try:
+            return await fut
+        except asyncio.CancelledError:
+            # Cancelled after being handed an engine: give it back
+            if fut.done() and not fut.cancelled():
+                self._release(fut.result(), priority)
+            raise
+
+    def _release(self, slot: int, priority: int):
+        if priority == BACKGROUND:
+            self._background -= 1
+        self._idle.append(slot)
+        self._dispatch()
+
+    async def _restart(self, slot: int):
+        try:
+            await self._engines[slot].quit()
+        except Exception:
+            pass
+        self._skills[slot] = None
+        self._engines[slot] = await self._spawn()
+
+    async def _settle(self, slot: int, priority: int):
+        # A cancelled search is still stopping; the engine is free once it answers
+        try:
+            await self._engines[slot].ping()
+        except Exception:
+            try:
+                await self._restart(slot)
+            except Exception as e:
+                print(f"Failed to restart engine {slot}: {e}")
+        finally:
+            self._release(slot, priority)
+
+    async def _run(self, skill, priority, command):
+        label = 'foreground' if priority == FOREGROUND else 'background'
+        with ENGINE_WAIT_SECONDS.time(label):
+            slot = await self._acquire(priority)
+        settling = False
+        try:
+            for attempt in range(2):
+                engine = self._engines[slot]
+                try:
+                    if skill is not None and self._skills[slot] != skill:
+                        await engine.configure({"Skill Level": int(skill)})
+                        self._skills[slot] = skill
+                    with ENGINE_SEARCH_SECONDS.time(label):
+                        return await command(engine)
+                except chess.engine.EngineTerminatedError:
+                    if attempt:
+                        raise
+                    await self._restart(slot)
+        except asyncio.CancelledError:
+            # Handing the engine on now would queue a second command behind
+            # the one still stopping, which python-chess does not allow
+            settling = True
+            task = asyncio.create_task(self._settle(slot, priority))
+            self._settling.add(task)
+            task.add_done_callback(self._settling.discard)
+            raise
+        finally:
+            if not settling:
+                self._release(slot, priority)
+
+    async def play(self, board: chess.Board, skill: int | None = None,
+                   limit: chess.engine.Limit = DEFAULT_ENGINE_LIMIT,
+                   priority: int = FOREGROUND) -> chess.Move:
+        # Copy so the caller's board can change while we wait for an engine
+        board = board.copy()
+        result = await self._run(skill, priority, lambda engine: engine.play(board, limit))
+        return result.move
+
+    async def candidate_moves(self, board: chess.Board, limit: chess.engine.Limit, count: int,
+                              priority: int = BACKGROUND) -> list[chess.Move]:
+        """Return up to ``count`` moves the engine rates highest (MultiPV)."""
+        board = board.copy()
+        infos = await self._run(None, priority,
+                                lambda engine: engine.analyse(board, limit, multipv=count))
+        return [info['pv'][0] for info in infos if info.get('pv')]
+
+    async def close(self):
+        for slot, engine in enumerate(self._engines):
+            if engine is None:
+                continue
+            try:
+                await engine.quit()
+            except Exception:
+                pass
+            self._engines[slot] = None
+        self._idle.clear()
+        self.started = False
+
+engine_pool = EnginePool(
+    STOCKFISH_PATH,
+    int(os.getenv("CHESSBOT_ENGINES", "0")) or max(1, (os.cpu_count() or 2) // 2),
+)
+
+class MoveCache:
+    """LRU cache of engine best moves keyed by position, skill and search limit.
+
+    Entries are bounded by ``max_entries``. If ``db_path`` is set, results are
+    also written to a small SQLite file so popular positions stay warm across
+    restarts; memory misses fall back to that file before asking the engine.
+    """
+
+    def __init__(self, max_entries: int = 100_000, db_path: str | None = None):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._db = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS move_cache (key TEXT PRIMARY KEY, move TEXT NOT NULL)")
+            self._db.commit()
+
+    @staticmethod
+    def key(board: chess.Board, skill, limit: chess.engine.Limit) -> str:
+        # EPD drops the move counters, so transpositions share an entry
+        return f"{board.epd()}|{skill}|{limit.time}|{limit.depth}|{limit.nodes}"
+
+    def _remember(self, key: str, uci: str):
+        self._entries[key] = uci
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _load(self, key: str):
+        with self._db_lock:
+            row = self._db.execute("SELECT move FROM move_cache WHERE key=?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _store(self, key: str, uci: str):
+        with self._db_lock:
+            self._db.execute("INSERT OR REPLACE INTO move_cache(key, move) VALUES (?, ?)", (key, uci))
+            self._db.commit()
+
+    async def get(self, key: str):
+        uci = self._entries.get(key)
+        if uci is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return chess.Move.from_uci(uci)
+        if self._db is not None:
+            uci = await asyncio.to_thread(self._load, key)
+            if uci is not None:
+                self._remember(key, uci)
+                self.disk_hits += 1
+                return chess.Move.from_uci(uci)
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, move: chess.Move):
+        self._remember(key, move.uci())
+        if self._db is not None:
+            await asyncio.to_thread(self._store, key, move.uci())
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+move_cache = MoveCache(
+    max_entries=int(os.getenv("CHESSBOT_MOVE_CACHE_SIZE", "100000")),
+    db_path=os.getenv("CHESSBOT_MOVE_CACHE_DB") or None,
+)
+
+async def best_move(board: chess.Board, skill: int | None = None,
+                    limit: chess.engine.Limit = DEFAULT_ENGINE_LIMIT,
+                    priority: int = FOREGROUND) -> chess.Move:
+    """Return the engine's move for ``board``, from the cache when possible."""
+    key = move_cache.key(board, skill, limit)
+    move = await move_cache.get(key)
+    if move is None:
+        move = await engine_pool.play(board, skill=skill, limit=limit, priority=priority)
+        await move_cache.put(key, move)
+    return move
+
+class Ponderer:
+    """Speculative analysis while a player thinks in an AI game.
+
+    Runs at background priority in the engine pool and fills the move cache
+    with the hint for the current position and the engine's reply to each
+    of the player's likely moves. The task is cancelled as soon as the
+    player moves or leaves the game.
+    """
+
+    def __init__(self, replies: int = 3, scan_limit: chess.engine.Limit = chess.engine.Limit(time=0.1)):
+        self.replies = replies
+        self.scan_limit = scan_limit
+        self._tasks = {}
+
+    def start(self, key, board: chess.Board, skill: int, limit: chess.engine.Limit):
+        self.cancel(key)
+        if self.replies <= 0 or engine_pool.max_background == 0:
+            return
+        task = asyncio.create_task(self._ponder(board.copy(), skill, limit))
+        self._tasks[key] = task
+        task.add_done_callback(lambda t: self._tasks.pop(key, None) if self._tasks.get(key) is t else None)
+
+    def cancel(self, key):
+        task = self._tasks.pop(key, None)
+        if task is not None:
+            task.cancel()
+
+    async def _ponder(self, board: chess.Board, skill: int, limit: chess.engine.Limit):
+        try:
+            # What !hint would ask for
+            await best_move(board, skill, limit, priority=BACKGROUND)
+            # What ai_move will ask for after each likely reply
+            for move in await engine_pool.candidate_moves(board, self.scan_limit, self.replies):
+                board.push(move)
+                if not board.is_game_over():
+                    await best_move(board, skill, limit, priority=BACKGROUND)
+                board.pop()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Pondering failed: {e}")
+
+ponderer = Ponderer(replies=int(os.getenv("CHESSBOT_PONDER_REPLIES", "3")))
 
 ############################
 # Persistence and ELO Setup #
@@ -43,8 +689,81 @@ stockfish = Stockfish(STOCKFISH_PATH)
 
 DB_PATH = os.getenv("CHESSBOT_DB", "chessbot.db")
 
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
+class Database:
+    """Long-lived SQLite connections behind an async API.
+
+    Writes run on one dedicated writer thread, so they are serialized without
+    lock contention and each ``write`` call is a single transaction. Reads run
+    on a small pool of reader threads, each with its own connection; WAL mode
+    lets them proceed while the writer commits. Connections are opened once
+    per thread and keep sqlite3's prepared statement cache warm.
+    """
+
+    def __init__(self, path: str, readers: int = 2):
+        self.path = path
+        self._local = threading.local()
+        self._conns = []
+        self._conns_lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, cached_statements=256, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+            with self._conns_lock:
+                self._conns.append(conn)
+        return conn
+
+    def _run_write(self, fn, args):
+        conn = self._connection()
+        try:
+            result = fn(conn, *args)
+            conn.commit()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _run_read(self, fn, args):
+        return fn(self._connection(), *args)
+
+    async def write(self, fn, *args):
+        """Run ``fn(conn, *args)`` on the writer thread inside one transaction."""
+        loop = asyncio.get_running_loop()
+        with DB_SECONDS.time('write'):
+            return await loop.run_in_executor(self._writer, self._run_write, fn, args)
+
+    async def read(self, fn, *args):
+        """Run ``fn(conn, *args)`` on a reader thread."""
+        loop = asyncio.get_running_loop()
+        with DB_SECONDS.time('read'):
+            return await loop.run_in_executor(self._readers, self._run_read, fn, args)
+
+    async def execute(self, sql: str, params=()) -> int:
+        return await self.write(lambda conn: conn.execute(sql, params).lastrowid)
+
+    async def fetchone(self, sql: str, params=()):
+        return await self.read(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql: str, params=()):
+        return await self.read(lambda conn: conn.execute(sql, params).fetchall())
+
+    def close(self):
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        with self._conns_lock:
+            for conn in self._conns:
+                conn.close()
+            self._conns.clear()
+
+db = Database(DB_PATH)
+
+def _create_schema(conn):
     c = conn.cursor()
     c.execute(
         """
@@ -105,95 +824,624 @@ def init_db():
         )
         """
     )
+    c.execute("CREATE INDEX IF NOT EXISTS idx_players_rating ON players(rating DESC)")
+    # Covers the per-round status counts and winner lookups used by advancement
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tmatches_round ON tournament_matches(tournament_id, round, status, winner_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_tplayers ON tournament_players(tournament_id, user_id)")
+    # A player's recorded games, e.g. the default !pgn lookup
+    c.execute("CREATE INDEX IF NOT EXISTS idx_games_white ON games(white_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_games_black ON games(black_id)")
     # Ensure schema has is_tiebreak column (for draw replays)
     try:
         c.execute("ALTER TABLE tournament_matches ADD COLUMN is_tiebreak INTEGER NOT NULL DEFAULT 0")
     except sqlite3.OperationalError:
         # Column likely exists already
         pass
-    conn.commit()
-    conn.close()
-
-def get_or_create_player(user_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT user_id, rating, wins, losses, draws FROM players WHERE user_id=?", (user_id,))
-    row = c.fetchone()
-    if not row:
-        c.execute(
-            "INSERT INTO players(user_id, rating, wins, losses, draws, updated_at) VALUES (?, 1200, 0, 0, 0, ?)",
-            (user_id, datetime.datetime.utcnow().isoformat()),
+    # Tournament format ('elimination' or 'swiss') and Swiss round count;
+    # per-match result so Swiss standings can count draws
+    for table, column in (("tournaments", "format TEXT NOT NULL DEFAULT 'elimination'"),
+                          ("tournaments", "rounds INTEGER"),
+                          ("tournament_matches", "result TEXT")):
+        try:
+            c.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+        except sqlite3.OperationalError:
+            pass
+    # Idle games in progress moved out of memory by GameStore
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS parked_games (
+            white_id INTEGER NOT NULL,
+            black_id INTEGER NOT NULL,
+            mode TEXT NOT NULL,
+            tournament_id INTEGER,
+            match_id INTEGER,
+            gid INTEGER,
+            fen TEXT NOT NULL,
+            moves BLOB NOT NULL,
+            parked_at TEXT,
+            PRIMARY KEY (white_id, black_id)
         )
-        conn.commit()
-        c.execute("SELECT user_id, rating, wins, losses, draws FROM players WHERE user_id=?", (user_id,))
-        row = c.fetchone()
-    conn.close()
-    return row  # (user_id, rating, wins, losses, draws)
+        """
+    )
+    # Packed move list (see pack_moves); pgn is only kept for legacy rows
+    for column in ("moves BLOB", "ply_count INTEGER"):
+        try:
+            c.execute(f"ALTER TABLE games ADD COLUMN {column}")
+        except sqlite3.OperationalError:
+            pass
 
-def update_player_stats(user_id: int, result: str):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    if result == "win":
-        c.execute("UPDATE players SET wins = wins + 1, updated_at=? WHERE user_id=?", (datetime.datetime.utcnow().isoformat(), user_id))
-    elif result == "loss":
-        c.execute("UPDATE players SET losses = losses + 1, updated_at=? WHERE user_id=?", (datetime.datetime.utcnow().isoformat(), user_id))
-    elif result == "draw":
-        c.execute("UPDATE players SET draws = draws + 1, updated_at=? WHERE user_id=?", (datetime.datetime.utcnow().isoformat(), user_id))
-    conn.commit()
-    conn.close()
+async def init_db():
+    await db.write(_create_schema)
 
 def expected_score(r_a: float, r_b: float) -> float:
     return 1 / (1 + 10 ** ((r_b - r_a) / 400))
 
-def update_elo(white_id: int, black_id: int, result: str, k: int = 32):
-    # result: '1-0' white wins, '0-1' black wins, '1/2-1/2' draw
-    w = get_or_create_player(white_id)
-    b = get_or_create_player(black_id)
-    r_w, r_b = float(w[1]), float(b[1])
-    exp_w = expected_score(r_w, r_b)
-    exp_b = expected_score(r_b, r_w)
-    if result == '1-0':
-        s_w, s_b = 1.0, 0.0
-        update_player_stats(white_id, "win")
-        update_player_stats(black_id, "loss")
-    elif result == '0-1':
-        s_w, s_b = 0.0, 1.0
-        update_player_stats(white_id, "loss")
-        update_player_stats(black_id, "win")
-    else:
-        s_w, s_b = 0.5, 0.5
-        update_player_stats(white_id, "draw")
-        update_player_stats(black_id, "draw")
-
-    new_r_w = r_w + k * (s_w - exp_w)
-    new_r_b = r_b + k * (s_b - exp_b)
-
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    now = datetime.datetime.utcnow().isoformat()
-    c.execute("UPDATE players SET rating=?, updated_at=? WHERE user_id=?", (new_r_w, now, white_id))
-    c.execute("UPDATE players SET rating=?, updated_at=? WHERE user_id=?", (new_r_b, now, black_id))
-    conn.commit()
-    conn.close()
+# (white score, black score) per result
+RESULT_SCORES = {
+    '1-0': (1.0, 0.0),
+    '0-1': (0.0, 1.0),
+    '1/2-1/2': (0.5, 0.5),
+}
 
-def record_game(white_id: int, black_id: int, result: str, game_board: chess.Board):
+def pack_moves(moves) -> bytes:
+    """Pack moves into 16 bits each: from (6) | to (6) << 6 | promotion (3) << 12."""
+    return struct.pack(f"<{len(moves)}H", *(
+        mv.from_square | (mv.to_square << 6) | ((mv.promotion or 0) << 12) for mv in moves
+    ))
+
+def unpack_moves(data: bytes) -> list[chess.Move]:
+    return [
+        chess.Move(code & 0x3F, (code >> 6) & 0x3F, (code >> 12) or None)
+        for code in struct.unpack(f"<{len(data) // 2}H", data)
+    ]
+
+def replay_moves(data: bytes) -> chess.Board:
+    board = chess.Board()
+    for mv in unpack_moves(data):
+        board.push(mv)
+    return board
+
+def _game_pgn(white_id: int, black_id: int, result: str, moves) -> str:
     # Export PGN
     game = chess.pgn.Game()
     game.headers["White"] = str(white_id)
     game.headers["Black"] = str(black_id)
     game.headers["Result"] = result
     node = game
-    for mv in game_board.move_stack:
+    for mv in moves:
         node = node.add_variation(mv)
-    pgn_str = str(game)
-    conn = sqlite3.connect(DB_PATH)
+    return str(game)
+
+def _finalize_games_tx(conn, finished, k):
+    """Apply ELO, W/L/D and the game record for each finished game.
+
+    Runs inside one writer transaction. Games are applied in order, so a
+    player appearing in several games of a batch is rated sequentially.
+    Returns the ``(user_id, new_rating)`` changes.
+    """
     c = conn.cursor()
-    c.execute(
-        "INSERT INTO games(white_id, black_id, result, pgn, created_at) VALUES (?, ?, ?, ?, ?)",
-        (white_id, black_id, result, pgn_str, datetime.datetime.utcnow().isoformat()),
-    )
-    conn.commit()
-    conn.close()
+    now = datetime.datetime.utcnow().isoformat()
+    updates = []
+    for white_id, black_id, result, moves in finished:
+        c.executemany(
+            "INSERT OR IGNORE INTO players(user_id, rating, wins, losses, draws, updated_at) VALUES (?, 1200, 0, 0, 0, ?)",
+            ((white_id, now), (black_id, now)),
+        )
+        r_w = c.execute("SELECT rating FROM players WHERE user_id=?", (white_id,)).fetchone()[0]
+        r_b = c.execute("SELECT rating FROM players WHERE user_id=?", (black_id,)).fetchone()[0]
+        s_w, s_b = RESULT_SCORES.get(result, (0.5, 0.5))
+        new_r_w = r_w + k * (s_w - expected_score(r_w, r_b))
+        new_r_b = r_b + k * (s_b - expected_score(r_b, r_w))
+        for uid, rating, score in ((white_id, new_r_w, s_w), (black_id, new_r_b, s_b)):
+            c.execute(
+                "UPDATE players SET rating=?, wins=wins+?, losses=losses+?, draws=draws+?, updated_at=? WHERE user_id=?",
+                (rating, int(score == 1.0), int(score == 0.0), int(score == 0.5), now, uid),
+            )
+            updates.append((uid, rating))
+        c.execute(
+            "INSERT INTO games(white_id, black_id, result, moves, ply_count, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (white_id, black_id, result, pack_moves(moves), len(moves), now),
+        )
+    return updates
+
+async def finalize_games(finished, k: int = 32):
+    """Rate and record several finished games in a single transaction.
+
+    ``finished`` is an iterable of ``(white_id, black_id, result, board)``;
+    result is '1-0', '0-1' or '1/2-1/2'. Used when a batch of games, such as
+    a tournament round, ends together.
+    """
+    # Snapshot move lists now; they are packed on the writer thread
+    await _finalize_batch([(w, b, result, list(board.move_stack)) for w, b, result, board in finished], k)
+
+async def _finalize_batch(batch, k: int = 32):
+    if batch:
+        leaderboard.apply_ratings(await db.write(_finalize_games_tx, batch, k))
+
+async def finalize_game(white_id: int, black_id: int, result: str, game_board: chess.Board, k: int = 32):
+    """Update both ratings and W/L/D counters and store the game, atomically."""
+    await finalize_games([(white_id, black_id, result, game_board)], k)
+
+async def export_pgn(game_id: int):
+    """Build the PGN for a stored game, or return None if it does not exist."""
+    row = await db.fetchone("SELECT white_id, black_id, result, pgn, moves FROM games WHERE id=?", (game_id,))
+    if not row:
+        return None
+    white_id, black_id, result, pgn_str, moves = row
+    if pgn_str is not None:
+        return pgn_str
+    return _game_pgn(white_id, black_id, result, unpack_moves(moves or b""))
+
+def _pack_pgn_rows(rows):
+    packed = []
+    for game_id, pgn_str in rows:
+        game = chess.pgn.read_game(StringIO(pgn_str))
+        if game is None or game.errors:
+            # Keep the text; an empty BLOB marks the row as visited
+            packed.append((b"", None, pgn_str, game_id))
+            continue
+        moves = list(game.mainline_moves())
+        packed.append((pack_moves(moves), len(moves), None, game_id))
+    return packed
+
+async def migrate_pgn_games(batch_size: int = 200):
+    """Convert legacy PGN text rows to packed moves, one batch at a time.
+
+    Parsing happens off the writer thread and each batch is its own short
+    transaction, so the migration can run alongside normal traffic.
+    """
+    last_id = 0
+    converted = 0
+    while True:
+        rows = await db.fetchall(
+            "SELECT id, pgn FROM games WHERE id > ? AND moves IS NULL AND pgn IS NOT NULL ORDER BY id LIMIT ?",
+            (last_id, batch_size))
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        packed = await asyncio.to_thread(_pack_pgn_rows, rows)
+        await db.write(lambda conn: conn.executemany(
+            "UPDATE games SET moves=?, ply_count=?, pgn=? WHERE id=?", packed))
+        converted += len(rows)
+    if converted:
+        print(f"Converted {converted} stored games to packed moves")
+
+def _report_migration(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        e = task.exception()
+        print(f"Stored game migration failed: {e!r}")
+        traceback.print_exception(type(e), e, e.__traceback__)
+
+class GameRecorder:
+    """Write-behind queue for finished games.
+
+    Handlers ``submit`` a finished game and reply right away. A background
+    task groups queued games into one finalize transaction, flushing once
+    ``batch_size`` games are waiting or ``flush_interval`` seconds after the
+    first one arrived. ``close`` drains whatever is still queued. A game
+    submitted with its journal ``gid`` keeps its journal entry, tagged with
+    the result, until the batch commits, so a crash before then re-records
+    it on restart instead of losing it.
+    """
+
+    def __init__(self, batch_size: int = 64, flush_interval: float = 0.5):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = asyncio.Queue()
+        self._full = asyncio.Event()
+        self._task = None
+        self._closed = False
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def start(self):
+        if self._task is None:
+            self._closed = False
+            self._task = asyncio.create_task(self._run())
+
+    def submit(self, white_id: int, black_id: int, result: str, game_board: chess.Board, gid: int | None = None):
+        journal.update(gid, result=result)
+        item = (white_id, black_id, result, list(game_board.move_stack), gid)
+        if self._task is None or self._closed:
+            # Not running (startup/shutdown): record without batching
+            asyncio.create_task(self._flush([item]))
+            return
+        self._queue.put_nowait(item)
+        if self._queue.qsize() >= self.batch_size:
+            self._full.set()
+
+    async def _flush(self, batch):
+        try:
+            await _finalize_batch([item[:4] for item in batch])
+        except Exception as e:
+            print(f"Failed to record {len(batch)} finished game(s): {e}")
+            return
+        for item in batch:
+            journal.end(item[4])
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            # Linger so games finishing together share a transaction
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            if self._queue.qsize() >= self.batch_size:
+                # A full batch is already waiting; don't linger for it
+                self._full.set()
+            stop = None in batch
+            await self._flush([item for item in batch if item is not None])
+            if stop:
+                return
+
+    async def close(self):
+        if self._task is None:
+            return
+        self._closed = True
+        self._queue.put_nowait(None)
+        self._full.set()
+        await self._task
+        self._task = None
+
+recorder = GameRecorder(
+    batch_size=int(os.getenv("CHESSBOT_RECORDER_BATCH", "64")),
+    flush_interval=float(os.getenv("CHESSBOT_RECORDER_FLUSH_SECONDS", "0.5")),
+)
+
+class GameJournal:
+    """Append-only log of games in progress, so a restart does not lose them.
+
+    Every record starts with a type byte and a 32-bit game id. A move is
+    two more bytes (the ``pack_moves`` encoding); starting a game writes
+    its JSON metadata and any moves already played. ``open`` replays the
+    file and returns the games that never ended; a torn last record from
+    a crash is dropped. A background task fsyncs new records every
+    ``sync_interval`` seconds and every ``compact_interval`` seconds
+    rewrites the file as one start record per live game.
+    """
+
+    MAGIC = b"CBJ1"
+    START, MOVE, UPDATE, END = range(1, 5)
+    _HEADER = struct.Struct("<BI")
+    _LENGTHS = struct.Struct("<HI")
+
+    def __init__(self, path: str | None, sync_interval: float = 1.0, compact_interval: float = 300.0):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.compact_interval = compact_interval
+        # gid -> [encoded metadata, packed moves]
+        self._live = {}
+        self._next_gid = 1
+        self._file = None
+        self._dirty = False
+        self._appended = 0
+        self._pending = None
+        self._task = None
+
+    @property
+    def live(self) -> int:
+        return len(self._live)
+
+    def _start_record(self, gid: int, meta: bytes, moves) -> bytes:
+        return self._HEADER.pack(self.START, gid) + self._LENGTHS.pack(len(meta), len(moves)) + meta + moves
+
+    def _load(self, data: bytes) -> int:
+        """Apply the records in ``data``; return the length of the intact prefix."""
+        header, lengths = self._HEADER, self._LENGTHS
+        pos, end = len(self.MAGIC), len(data)
+        while pos + header.size <= end:
+            kind, gid = header.unpack_from(data, pos)
+            body = pos + header.size
+            if kind == self.MOVE:
+                if body + 2 > end:
+                    break
+                if gid in self._live:
+                    self._live[gid][1] += data[body:body + 2]
+                pos = body + 2
+            elif kind == self.END:
+                self._live.pop(gid, None)
+                pos = body
+            elif kind in (self.START, self.UPDATE):
+                if body + lengths.size > end:
+                    break
+                meta_len, moves_len = lengths.unpack_from(data, body)
+                meta_end = body + lengths.size + meta_len
+                if meta_end + moves_len > end:
+                    break
+                meta = data[body + lengths.size:meta_end]
+                if kind == self.START:
+                    self._live[gid] = [meta, bytearray(data[meta_end:meta_end + moves_len])]
+                elif gid in self._live:
+                    merged = {**json.loads(self._live[gid][0]), **json.loads(meta)}
+                    self._live[gid][0] = json.dumps(merged, separators=(',', ':')).encode()
+                pos = meta_end + moves_len
+            else:
+                break
+            self._next_gid = max(self._next_gid, gid + 1)
+        return pos
+
+    def open(self) -> list[tuple[int, dict, bytes]]:
+        """Open the journal and return ``(gid, metadata, packed moves)`` per live game."""
+        if not self.path:
+            return []
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b""
+        if data and not data.startswith(self.MAGIC):
+            raise ValueError(f"{self.path} is not a game journal")
+        self._live.clear()
+        good = self._load(data) if data else 0
+        self._file = open(self.path, 'ab', buffering=0)
+        if not data:
+            self._file.write(self.MAGIC)
+        elif good < len(data):
+            print(f"Game journal: dropping {len(data) - good} bytes of a torn record")
+            self._file.truncate(good)
+        return [(gid, json.loads(meta), bytes(moves)) for gid, (meta, moves) in self._live.items()]
+
+    def _append(self, record: bytes):
+        self._file.write(record)
+        self._dirty = True
+        self._appended += 1
+        if self._pending is not None:
+            self._pending.append(record)
+
+    def start(self, meta: dict, moves: bytes = b"") -> int | None:
+        """Journal a new game and return its id (None when journaling is off)."""
+        if self._file is None:
+            return None
+        gid = self._next_gid
+        self._next_gid += 1
+        encoded = json.dumps(meta, separators=(',', ':')).encode()
+        self._live[gid] = [encoded, bytearray(moves)]
+        self._append(self._start_record(gid, encoded, moves))
+        return gid
+
+    def move(self, gid: int | None, move: chess.Move):
+        if gid is None or self._file is None or gid not in self._live:
+            return
+        packed = pack_moves((move,))
+        self._live[gid][1] += packed
+        self._append(self._HEADER.pack(self.MOVE, gid) + packed)
+
+    def update(self, gid: int | None, **changes):
+        if gid is None or self._file is None or gid not in self._live:
+            return
+        merged = {**json.loads(self._live[gid][0]), **changes}
+        self._live[gid][0] = json.dumps(merged, separators=(',', ':')).encode()
+        encoded = json.dumps(changes, separators=(',', ':')).encode()
+        self._append(self._HEADER.pack(self.UPDATE, gid) + self._LENGTHS.pack(len(encoded), 0) + encoded)
+
+    def end(self, gid: int | None):
+        if gid is None or self._file is None or self._live.pop(gid, None) is None:
+            return
+        self._append(self._HEADER.pack(self.END, gid))
+
+    def _write_snapshot(self, path: str, data: bytes):
+        with open(path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def sync(self):
+        if self._dirty and self._file is not None:
+            self._dirty = False
+            await asyncio.to_thread(os.fsync, self._file.fileno())
+
+    async def compact(self):
+        """Rewrite the journal as a snapshot of the live games."""
+        if self._file is None:
+            return
+        snapshot = b"".join(self._start_record(gid, meta, moves) for gid, (meta, moves) in self._live.items())
+        tmp = self.path + ".tmp"
+        # Records appended while the snapshot is written go into both files
+        self._pending = []
+        try:
+            await asyncio.to_thread(self._write_snapshot, tmp, self.MAGIC + snapshot)
+            with open(tmp, 'ab') as f:
+                f.write(b"".join(self._pending))
+            os.replace(tmp, self.path)
+            self._file.close()
+            self._file = open(self.path, 'ab', buffering=0)
+            self._appended = 0
+        finally:
+            self._pending = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_compact = loop.time() + self.compact_interval
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            try:
+                if self._appended and loop.time() >= next_compact:
+                    await self.compact()
+                    next_compact = loop.time() + self.compact_interval
+                await self.sync()
+            except OSError as e:
+                print(f"Game journal write failed: {e}")
+
+    def start_task(self):
+        if self._task is None and self._file is not None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._file is not None:
+            await self.sync()
+            self._file.close()
+            self._file = None
+
+journal = GameJournal(
+    os.getenv("CHESSBOT_JOURNAL", os.path.splitext(DB_PATH)[0] + ".journal"),
+    sync_interval=float(os.getenv("CHESSBOT_JOURNAL_SYNC_SECONDS", "1")),
+    compact_interval=float(os.getenv("CHESSBOT_JOURNAL_COMPACT_SECONDS", "300")),
+)
+
+######################
+# Outbound Messages #
+######################
+
+# Discord's per-message limits
+MESSAGE_LIMIT = 2000
+ATTACHMENT_LIMIT = 10
+
+def split_message(text: str, limit: int = MESSAGE_LIMIT) -> list[str]:
+    """Split text into chunks under ``limit``, at line breaks where possible."""
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit + 1)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    if text or not chunks:
+        chunks.append(text)
+    return chunks
+
+def coalesce_messages(items) -> list[tuple[str, list]]:
+    """Merge queued ``(content, files)`` pairs into as few messages as fit Discord's limits."""
+    merged = []
+    text, files = "", []
+    for content, item_files in items:
+        chunks = split_message(content)
+        for i, chunk in enumerate(chunks):
+            # Attachments ride with the last chunk of their text
+            extra = item_files if i == len(chunks) - 1 else []
+            joined = f"{text}\n{chunk}" if text and chunk else text or chunk
+            if len(joined) > MESSAGE_LIMIT or len(files) + len(extra) > ATTACHMENT_LIMIT:
+                merged.append((text, files))
+                joined, files = chunk, []
+            text = joined
+            files = files + list(extra)
+    if text or files:
+        merged.append((text, files))
+    return merged
+
+class SendBucket:
+    """Token bucket matching Discord's per-channel send limit.
+
+    Waiting here keeps us under the limit instead of running into 429s and
+    the client's retry backoff.
+    """
+
+    def __init__(self, rate: int, per: float):
+        self.rate = rate
+        self.per = per
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate / self.per)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) * self.per / self.rate)
+
+class Outbox:
+    """Per-channel send queue.
+
+    Sends to one channel go out in order, one at a time, each paced by the
+    channel's token bucket. Batches from a command are merged first, so a
+    move reply, its game-over notice and the turn prompt cost one API call.
+    """
+
+    def __init__(self, rate: int = 5, per: float = 5.0):
+        self.rate = rate
+        self.per = per
+        self._buckets = {}
+        self._locks = {}
+        self.sent = 0
+        self.queued = 0
+
+    def _channel(self, channel_id: int):
+        if channel_id not in self._locks:
+            self._locks[channel_id] = asyncio.Lock()
+            self._buckets[channel_id] = SendBucket(self.rate, self.per)
+        return self._locks[channel_id], self._buckets[channel_id]
+
+    async def call(self, channel_id: int, send, *args, **kwargs):
+        """Run one send coroutine in the channel's turn and return its result."""
+        lock, bucket = self._channel(channel_id)
+        async with lock:
+            await bucket.acquire()
+            self.sent += 1
+            with SEND_SECONDS.time():
+                return await send(*args, **kwargs)
+
+    async def deliver(self, channel_id: int, send, items):
+        """Send queued ``(content, files)`` pairs merged; returns the last message."""
+        self.queued += len(items)
+        message = None
+        for content, files in coalesce_messages(items):
+            message = await self.call(channel_id, send, content or None, files=files or None)
+        return message
+
+outbox = Outbox(
+    rate=int(os.getenv("CHESSBOT_SEND_RATE", "5")),
+    per=float(os.getenv("CHESSBOT_SEND_PER_SECONDS", "5")),
+)
+
+class OutboxContext(commands.Context):
+    """Command context whose plain sends are held and merged until the command ends.
+
+    Only text and file sends are held. Anything else (views, embeds, ...)
+    flushes what is held and goes out right away, as does ``send_now`` for
+    callers that need the sent message back.
+    """
+
+    _batch = None
+
+    async def send(self, content=None, **kwargs):
+        if set(kwargs) <= {'file', 'files'}:
+            files = list(kwargs.get('files') or ())
+            if kwargs.get('file') is not None:
+                files.append(kwargs['file'])
+            item = ("" if content is None else str(content), files)
+            if self._batch is not None:
+                self._batch.append(item)
+                return None
+            return await outbox.deliver(self.channel.id, super().send, [item])
+        return await self.send_now(content, **kwargs)
+
+    async def send_now(self, content=None, **kwargs):
+        await self.flush()
+        return await outbox.call(self.channel.id, super().send, content, **kwargs)
+
+    def hold(self):
+        if self._batch is None:
+            self._batch = []
+
+    async def flush(self, release: bool = False):
+        batch = self._batch
+        self._batch = None if release else ([] if batch is not None else None)
+        if batch:
+            await outbox.deliver(self.channel.id, super().send, batch)
+
+@bot.before_invoke
+async def _before_command(ctx):
+    ctx.started_at = time.perf_counter()
+    if isinstance(ctx, OutboxContext):
+        ctx.hold()
+
+@bot.after_invoke
+async def _after_command(ctx):
+    # Runs even when the command raised, so nothing held is lost
+    if isinstance(ctx, OutboxContext):
+        await ctx.flush(release=True)
+    COMMAND_SECONDS.observe(ctx.command.qualified_name, time.perf_counter() - ctx.started_at)
 
 @bot.event
 async def on_command_error(ctx, error):
@@ -206,14 +1454,12 @@ async def on_command_error(ctx, error):
         await ctx.send(
             "A required argument is missing. Please check the command and try again."
         )
+    elif isinstance(error, commands.CheckFailure):
+        await ctx.send("You don't have permission to use this command.")
     else:
         await ctx.send(f"An unexpected error occurred: {error}")
 
-board = chess.Board()
-mode = None
-player_color = None
-difficulty = 'normal'  
-current_turn = chess.WHITE
+DEFAULT_DIFFICULTY = 'normal'
 
 difficulty_map = {
     'peaceful': 1,
@@ -223,25 +1469,105 @@ difficulty_map = {
     'hardcore': 20,
 }
 
-async def choose_difficulty(ctx):
-    """Show buttons to set AI difficulty and configure Stockfish skill level."""
+class SearchBudget:
+    """Engine search limits for one difficulty.
+
+    ``movetime`` (seconds) and ``nodes`` shrink with the load scale, but never
+    below ``min_scale`` of their full value, so a difficulty keeps its
+    strength at peak load. ``depth`` is a fixed cap; the engine stops at
+    whichever limit it reaches first.
+    """
+
+    __slots__ = ('movetime', 'depth', 'nodes', 'min_scale')
+
+    def __init__(self, movetime: float, depth: int | None, nodes: int, min_scale: float = 1.0):
+        self.movetime = movetime
+        self.depth = depth
+        self.nodes = nodes
+        self.min_scale = min_scale
+
+    def limit(self, scale: float = 1.0) -> chess.engine.Limit:
+        scale = max(self.min_scale, min(1.0, scale))
+        return chess.engine.Limit(time=round(self.movetime * scale, 3), depth=self.depth,
+                                  nodes=int(self.nodes * scale))
+
+search_budgets = {
+    'peaceful': SearchBudget(0.05, 5, 20_000),
+    'easy': SearchBudget(0.1, 8, 50_000, min_scale=0.5),
+    'normal': SearchBudget(0.3, 12, 200_000, min_scale=0.35),
+    'hard': SearchBudget(0.8, 18, 800_000, min_scale=0.35),
+    'hardcore': SearchBudget(2.0, None, 3_000_000, min_scale=0.25),
+}
+
+class SearchController:
+    """Scales engine search budgets with engine load.
+
+    Every ``interval`` seconds it checks how many player requests wait per
+    engine; background pondering does not count. Above ``high`` it steps
+    down to the next smaller scale, below ``low`` it steps back up. Scales
+    come from a short fixed list, so the limits, and with them the move
+    cache keys, stay shared between games.
+    """
+
+    SCALES = (1.0, 0.7, 0.5, 0.35, 0.25)
+
+    def __init__(self, pool: EnginePool, high: float = 2.0, low: float = 0.5, interval: float = 1.0):
+        self.pool = pool
+        self.high = high
+        self.low = low
+        self.interval = interval
+        self.level = 0
+        self._task = None
+
+    @property
+    def scale(self) -> float:
+        return self.SCALES[self.level]
+
+    def limit(self, difficulty: str) -> chess.engine.Limit:
+        return search_budgets[difficulty].limit(self.scale)
+
+    def adjust(self, queue_depth: int):
+        per_engine = queue_depth / max(1, self.pool.size)
+        if per_engine > self.high and self.level < len(self.SCALES) - 1:
+            self.level += 1
+        elif per_engine < self.low and self.level > 0:
+            self.level -= 1
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.adjust(self.pool.foreground_depth)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+search_controller = SearchController(
+    engine_pool,
+    high=float(os.getenv("CHESSBOT_SEARCH_SHED_QUEUE", "2")),
+    low=float(os.getenv("CHESSBOT_SEARCH_RESTORE_QUEUE", "0.5")),
+)
+
+async def choose_difficulty(ctx, session):
+    """Show buttons to set the AI difficulty of this game session."""
     view = discord.ui.View(timeout=30)
 
     # Create one button per difficulty
-    for level, skill in difficulty_map.items():
+    for level in difficulty_map:
         btn = discord.ui.Button(label=level.capitalize(), style=discord.ButtonStyle.primary)
 
-        async def on_click(interaction: discord.Interaction, level=level, skill=skill):
-            global difficulty
-            difficulty = level
-            try:
-                # Configure engine skill level if supported
-                stockfish.set_skill_level(int(skill))
-            except Exception:
-                pass
-            await interaction.response.send_message(f"Difficulty set to `{difficulty}`.", ephemeral=True)
+        async def on_click(interaction: discord.Interaction, level=level):
+            # Skill is sent to the engine pool with each search request
+            session.difficulty = level
+            journal.update(session.gid, difficulty=level)
+            await interaction.response.send_message(f"Difficulty set to `{level}`.", ephemeral=True)
             # If it's AI's turn now, make it move
-            if mode == 'ai' and not board.is_game_over() and current_turn != player_color:
+            if _is_ai_turn(ctx, session):
                 await ai_move(ctx)
 
         btn.callback = on_click
@@ -251,15 +1577,11 @@ async def choose_difficulty(ctx):
     rnd = discord.ui.Button(label="Random", style=discord.ButtonStyle.secondary)
 
     async def on_random(interaction: discord.Interaction):
-        global difficulty
         level = random.choice(list(difficulty_map.keys()))
-        difficulty = level
-        try:
-            stockfish.set_skill_level(int(difficulty_map[level]))
-        except Exception:
-            pass
-        await interaction.response.send_message(f"Difficulty set to `{difficulty}`.", ephemeral=True)
-        if mode == 'ai' and not board.is_game_over() and current_turn != player_color:
+        session.difficulty = level
+        journal.update(session.gid, difficulty=level)
+        await interaction.response.send_message(f"Difficulty set to `{level}`.", ephemeral=True)
+        if _is_ai_turn(ctx, session):
             await ai_move(ctx)
 
     rnd.callback = on_random
@@ -267,125 +1589,697 @@ async def choose_difficulty(ctx):
 
     await ctx.send("Please choose the AI difficulty level:", view=view)
 
-def generate_board_image(board, perspective='white'):
-    square_size = 35
-    board_size = 8 * square_size
-    label_margin = 20
-    total_size = board_size + 2 * label_margin
-
-    board_image = Image.new("RGBA", (total_size, total_size),
-                            (255, 255, 255, 0))
-    draw = ImageDraw.Draw(board_image)
-    colors = [(255, 255, 255), (128, 128, 128)]  
-
-    for rank in range(8):
-        for file in range(8):
-            color = colors[(rank + file) % 2]
+SQUARE_SIZE = 35
+LABEL_MARGIN = 20
+PIECES_DIR = Path(__file__).parent / "assets" / "pieces"
+PIECE_FILES = {
+    'P': "white/white-pawn.png",
+    'R': "white/white-rook.png",
+    'N': "white/white-knight.png",
+    'B': "white/white-bishop.png",
+    'Q': "white/white-queen.png",
+    'K': "white/white-king.png",
+    'p': "black/black-pawn.png",
+    'r': "black/black-rook.png",
+    'n': "black/black-knight.png",
+    'b': "black/black-bishop.png",
+    'q': "black/black-queen.png",
+    'k': "black/black-king.png",
+}
+
+class BoardRenderer:
+    """Pre-renders everything that does not depend on the position.
+
+    Piece sprites are loaded and resized once, and the empty board with its
+    coordinate labels is composited once per perspective, so rendering a
+    position is a single copy plus one paste per piece.
+    """
+
+    def __init__(self, square_size=SQUARE_SIZE, label_margin=LABEL_MARGIN, pieces_dir=PIECES_DIR):
+        self.square_size = square_size
+        self.label_margin = label_margin
+        self.total_size = 8 * square_size + 2 * label_margin
+        self.sprites = {
+            symbol: Image.open(str(pieces_dir / rel)).convert("RGBA").resize(
+                (square_size, square_size), Image.LANCZOS)
+            for symbol, rel in PIECE_FILES.items()
+        }
+        self.backgrounds = {p: self._draw_background(p) for p in ('white', 'black')}
+        # Top-left pixel of every square, per perspective
+        self.offsets = {p: [self._square_offset(sq, p) for sq in chess.SQUARES] for p in ('white', 'black')}
+        # Empty square tiles, for repainting single squares
+        self.tiles = {
+            p: [self.backgrounds[p].crop((x, y, x + square_size, y + square_size))
+                for x, y in self.offsets[p]]
+            for p in ('white', 'black')
+        }
+
+    def _square_offset(self, square, perspective):
+        file = chess.square_file(square)
+        rank = chess.square_rank(square)
+        if perspective == 'white':
+            return (self.label_margin + file * self.square_size,
+                    self.label_margin + (7 - rank) * self.square_size)
+        return (self.label_margin + (7 - file) * self.square_size,
+                self.label_margin + rank * self.square_size)
+
+    def _draw_background(self, perspective):
+        square_size = self.square_size
+        label_margin = self.label_margin
+        total_size = self.total_size
+
+        board_image = Image.new("RGBA", (total_size, total_size),
+                                (255, 255, 255, 0))
+        draw = ImageDraw.Draw(board_image)
+        colors = [(255, 255, 255), (128, 128, 128)]
+
+        for rank in range(8):
+            for file in range(8):
+                color = colors[(rank + file) % 2]
+                draw.rectangle([
+                    label_margin + file * square_size,
+                    label_margin + rank * square_size, label_margin +
+                    (file + 1) * square_size, label_margin +
+                    (rank + 1) * square_size
+                ],
+                               fill=color)
+
+        font = ImageFont.load_default()
+        text_color = (255, 255, 255)
+        bg_color = (0, 0, 0)
+
+        for i in range(8):
+            rank_label = str(8 - i) if perspective == 'white' else str(i + 1)
+
             draw.rectangle([
-                label_margin + file * square_size,
-                label_margin + rank * square_size, label_margin +
-                (file + 1) * square_size, label_margin +
-                (rank + 1) * square_size
+                5, label_margin + i * square_size, label_margin - 5, label_margin +
+                (i + 1) * square_size
             ],
-                           fill=color)
-
-    font = ImageFont.load_default()
-    text_color = (255, 255, 255) 
-    bg_color = (0, 0, 0) 
-
-    for i in range(8):
-        rank_label = str(8 - i) if perspective == 'white' else str(i + 1)
-
-        draw.rectangle([
-            5, label_margin + i * square_size, label_margin - 5, label_margin +
-            (i + 1) * square_size
-        ],
-                       fill=bg_color)
-        draw.rectangle([
-            total_size - 15, label_margin + i * square_size, total_size,
-            label_margin + (i + 1) * square_size
-        ],
-                       fill=bg_color)
-
-        # Draw rank labels
-        draw.text((5, label_margin + i * square_size + square_size // 4),
-                  rank_label,
-                  fill=text_color,
-                  font=font)
-        draw.text((total_size - 15,
-                   label_margin + i * square_size + square_size // 4),
-                  rank_label,
-                  fill=text_color,
-                  font=font)
-     
-        file_label = chr(ord('a') +
-                         i) if perspective == 'white' else chr(ord('h') - i)
-
-        draw.rectangle([
-            label_margin + i * square_size, 5, label_margin +
-            (i + 1) * square_size, label_margin - 5
-        ],
-                       fill=bg_color)
-        draw.rectangle([
-            label_margin + i * square_size, total_size - 15, label_margin +
-            (i + 1) * square_size, total_size
-        ],
-                       fill=bg_color)
-
-        draw.text((label_margin + i * square_size + square_size // 4, 5),
-                  file_label,
-                  fill=text_color,
-                  font=font)
-        draw.text((label_margin + i * square_size + square_size // 4,
-                   total_size - 15),
-                  file_label,
-                  fill=text_color,
-                  font=font)
-
-    # Load piece images from organized asset folders
-    base_dir = Path(__file__).parent
-    pieces_dir = base_dir / "assets" / "pieces"
-    white_dir = pieces_dir / "white"
-    black_dir = pieces_dir / "black"
-
-    piece_images = {
-        'P': Image.open(str(white_dir / "white-pawn.png")).resize((35, 35), Image.LANCZOS),
-        'R': Image.open(str(white_dir / "white-rook.png")).resize((35, 35), Image.LANCZOS),
-        'N': Image.open(str(white_dir / "white-knight.png")).resize((35, 35), Image.LANCZOS),
-        'B': Image.open(str(white_dir / "white-bishop.png")).resize((35, 35), Image.LANCZOS),
-        'Q': Image.open(str(white_dir / "white-queen.png")).resize((35, 35), Image.LANCZOS),
-        'K': Image.open(str(white_dir / "white-king.png")).resize((35, 35), Image.LANCZOS),
-        'p': Image.open(str(black_dir / "black-pawn.png")).resize((35, 35), Image.LANCZOS),
-        'r': Image.open(str(black_dir / "black-rook.png")).resize((35, 35), Image.LANCZOS),
-        'n': Image.open(str(black_dir / "black-knight.png")).resize((35, 35), Image.LANCZOS),
-        'b': Image.open(str(black_dir / "black-bishop.png")).resize((35, 35), Image.LANCZOS),
-        'q': Image.open(str(black_dir / "black-queen.png")).resize((35, 35), Image.LANCZOS),
-        'k': Image.open(str(black_dir / "black-king.png")).resize((35, 35), Image.LANCZOS)
-    }
+                           fill=bg_color)
+            draw.rectangle([
+                total_size - 15, label_margin + i * square_size, total_size,
+                label_margin + (i + 1) * square_size
+            ],
+                           fill=bg_color)
+
+            # Draw rank labels
+            draw.text((5, label_margin + i * square_size + square_size // 4),
+                      rank_label,
+                      fill=text_color,
+                      font=font)
+            draw.text((total_size - 15,
+                       label_margin + i * square_size + square_size // 4),
+                      rank_label,
+                      fill=text_color,
+                      font=font)
+
+            file_label = chr(ord('a') +
+                             i) if perspective == 'white' else chr(ord('h') - i)
 
-    for square in chess.SQUARES:
-        piece = board.piece_at(square)
-        if piece:
-            file = chess.square_file(square)
-            rank = chess.square_rank(square)
-            piece_symbol = piece.symbol()
-         
-            if perspective == 'white':
-                pos = (label_margin + file * square_size,
-                       label_margin + (7 - rank) * square_size)
-            else:
-                pos = (label_margin + (7 - file) * square_size,
-                       label_margin + rank * square_size)
+            draw.rectangle([
+                label_margin + i * square_size, 5, label_margin +
+                (i + 1) * square_size, label_margin - 5
+            ],
+                           fill=bg_color)
+            draw.rectangle([
+                label_margin + i * square_size, total_size - 15, label_margin +
+                (i + 1) * square_size, total_size
+            ],
+                           fill=bg_color)
+
+            draw.text((label_margin + i * square_size + square_size // 4, 5),
+                      file_label,
+                      fill=text_color,
+                      font=font)
+            draw.text((label_margin + i * square_size + square_size // 4,
+                       total_size - 15),
+                      file_label,
+                      fill=text_color,
+                      font=font)
+        return board_image
+
+    def render(self, board, perspective='white'):
+        board_image = self.backgrounds[perspective].copy()
+        offsets = self.offsets[perspective]
+        for square, piece in board.piece_map().items():
+            sprite = self.sprites[piece.symbol()]
+            board_image.paste(sprite, offsets[square], sprite)
+        return board_image
+
+    def repaint(self, image, before, after, perspective='white', max_squares=8):
+        """Return a copy of ``image`` (showing ``before``) updated to show ``after``.
+
+        Only squares whose piece changed are repainted, which covers castling,
+        en passant and promotion alike. Returns None when more than
+        ``max_squares`` changed, as a full render is then no slower.
+        """
+        old, new = before.piece_map(), after.piece_map()
+        changed = [sq for sq in old.keys() | new.keys() if old.get(sq) != new.get(sq)]
+        if len(changed) > max_squares:
+            return None
+        board_image = image.copy()
+        offsets = self.offsets[perspective]
+        tiles = self.tiles[perspective]
+        for square in changed:
+            board_image.paste(tiles[square], offsets[square])
+            piece = new.get(square)
+            if piece is not None:
+                sprite = self.sprites[piece.symbol()]
+                board_image.paste(sprite, offsets[square], sprite)
+        return board_image
+
+renderer = BoardRenderer()
+
+class ImageEncoder:
+    """Turns rendered boards into upload bytes in the deployment's chosen format.
+
+    ``png`` (the default) writes the RGBA image as is. ``png8`` is lossy: it
+    quantizes to a 256-colour palette first. Anti-aliased piece edges give
+    a rendered board over a thousand distinct colours, so some pixels shift
+    by up to about 30 per channel, in exchange for a smaller, faster-written
+    file. ``webp`` is lossless WebP. ``level`` is the zlib level for the PNG
+    formats and the effort (0-6) for WebP.
+    """
+
+    EXTENSIONS = {'png': 'png', 'png8': 'png', 'webp': 'webp'}
+    DEFAULT_LEVELS = {'png': 3, 'png8': 6, 'webp': 0}
+
+    def __init__(self, fmt: str = 'png', level: int | None = None):
+        if fmt not in self.EXTENSIONS:
+            raise ValueError(f"Unknown image format: {fmt}")
+        self.format = fmt
+        self.extension = self.EXTENSIONS[fmt]
+        # A negative or missing level picks the format's tuned default
+        self.level = self.DEFAULT_LEVELS[fmt] if level is None or level < 0 else level
+
+    def encode(self, board_image) -> bytes:
+        buf = BytesIO()
+        if self.format == 'webp':
+            board_image.save(buf, format="WEBP", lossless=True, method=min(self.level, 6))
+        else:
+            if self.format == 'png8':
+                board_image = board_image.quantize(256, method=Image.Quantize.FASTOCTREE)
+            board_image.save(buf, format="PNG", compress_level=self.level)
+        return buf.getvalue()
+
+encoder = ImageEncoder(
+    fmt=os.getenv("CHESSBOT_IMAGE_FORMAT", "png"),
+    level=int(os.getenv("CHESSBOT_IMAGE_COMPRESS_LEVEL", "-1")),
+)
 
-            board_image.paste(piece_images[piece_symbol], pos,
-                              piece_images[piece_symbol])
+def generate_board_image(board, perspective='white'):
+    """Render the position and return the encoded image as an in-memory buffer."""
+    return BytesIO(encoder.encode(renderer.render(board, perspective)))
 
-    board_image.save("chessboard.png")
+def _render_encoded(board_fen: str, perspective: str) -> bytes:
+    # Executor entry point; takes a placement string so it is cheap to pickle
+    return generate_board_image(chess.BaseBoard(board_fen), perspective).getvalue()
+
+class BoardFrame:
+    """The last image rendered for one game, so the next only repaints what moved.
+
+    The RGBA image is about 400 KB, so ``RenderPool`` keeps images only for
+    its most recently rendered frames and clears the rest; a cleared frame
+    falls back to a full render.
+    """
+
+    __slots__ = ('image', 'board_fen', 'perspective')
 
-games = {}
-class Leaderboard:
     def __init__(self):
+        self.image = None
+        self.board_fen = None
+        self.perspective = None
+
+def _render_frame(prev, board_fen: str, perspective: str):
+    # Thread executor entry point; returns the new frame image and its encoding
+    board = chess.BaseBoard(board_fen)
+    board_image = None
+    if prev is not None:
+        prev_image, prev_fen, prev_perspective = prev
+        if prev_perspective == perspective:
+            board_image = renderer.repaint(prev_image, chess.BaseBoard(prev_fen), board, perspective)
+    if board_image is None:
+        board_image = renderer.render(board, perspective)
+    return board_image, encoder.encode(board_image)
+
+class ImageCache:
+    """LRU cache of encoded board images shared by every game.
+
+    Keyed by placement and perspective, so start positions and common
+    openings are encoded once for all players. Bounded by the total size of
+    the stored images rather than their count.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        data = self._entries.get(key)
+        if data is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return data
+
+    def put(self, key, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        self._entries[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+image_cache = ImageCache(
+    max_bytes=int(os.getenv("CHESSBOT_IMAGE_CACHE_BYTES", str(64 * 1024 * 1024))),
+)
+
+class RenderPool:
+    """Runs board rendering and image encoding off the event loop.
+
+    At most ``max_pending`` renders may be queued or running at once. Further
+    callers wait for a slot, so a burst of moves applies backpressure to the
+    handlers instead of piling up unbounded work behind the executor.
+    Positions already in ``cache`` are served without rendering. Only the
+    ``max_frames`` most recently rendered game frames keep their image.
+    """
+
+    def __init__(self, kind='thread', workers=None, max_pending=64, cache=None, max_frames=128):
+        if kind not in ('thread', 'process'):
+            raise ValueError(f"Unknown render executor: {kind}")
+        self.kind = kind
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.max_pending = max_pending
+        self.cache = cache
+        self.max_frames = max_frames
+        # Frames holding an image, least recently rendered first
+        self._frames = OrderedDict()
+        self._slots = asyncio.Semaphore(max_pending)
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.kind == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix="render")
+        return self._executor
+
+    async def render(self, board, perspective='white', frame=None) -> bytes:
+        # Snapshot the placement now; the caller may push moves while we wait
+        board_fen = board.board_fen()
+        key = (board_fen, perspective)
+        if self.cache is not None:
+            data = self.cache.get(key)
+            if data is not None:
+                # The frame keeps its older image; the next repaint diffs from that
+                return data
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            if frame is None or self.kind == 'process' or self.max_frames <= 0:
+                # Process workers would need the previous image pickled both ways
+                with RENDER_SECONDS.time('full'):
+                    data = await loop.run_in_executor(self._get_executor(), _render_encoded,
+                                                      board_fen, perspective)
+            else:
+                prev = None
+                if frame.image is not None:
+                    prev = (frame.image, frame.board_fen, frame.perspective)
+                with RENDER_SECONDS.time('frame'):
+                    image, data = await loop.run_in_executor(self._get_executor(), _render_frame,
+                                                             prev, board_fen, perspective)
+                frame.image, frame.board_fen, frame.perspective = image, board_fen, perspective
+                self._keep_frame(frame)
+        if self.cache is not None:
+            self.cache.put(key, data)
+        return data
+
+    def _keep_frame(self, frame):
+        self._frames[frame] = None
+        self._frames.move_to_end(frame)
+        while len(self._frames) > self.max_frames:
+            old, _ = self._frames.popitem(last=False)
+            old.image = None
+
+    @property
+    def frames(self) -> int:
+        return len(self._frames)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+render_pool = RenderPool(
+    kind=os.getenv("CHESSBOT_RENDER_EXECUTOR", "thread"),
+    workers=int(os.getenv("CHESSBOT_RENDER_WORKERS", "0")) or None,
+    max_pending=int(os.getenv("CHESSBOT_RENDER_QUEUE", "64")),
+    cache=image_cache,
+    max_frames=int(os.getenv("CHESSBOT_RENDER_FRAMES", "128")),
+)
+
+async def board_file(board, perspective='white', frame=None):
+    # Each message gets its own buffer, so concurrent games never share a file
+    data = await render_pool.render(board, perspective, frame)
+    return discord.File(BytesIO(data), filename=f"chessboard.{encoder.extension}")
+
+class GameSession:
+    """State of one solo or AI game.
+
+    Sessions live in ``sessions`` keyed by ``(channel_id, user_id)``, so any
+    number of solo/AI games can run side by side. A session restored from
+    the journal keeps its packed moves and replays them on first use.
+    """
+
+    __slots__ = ('_board', '_moves', 'mode', 'player_color', 'difficulty', 'frame', 'gid', 'lock')
+
+    def __init__(self, mode: str, player_color: bool, difficulty: str = DEFAULT_DIFFICULTY, moves: bytes = b""):
+        self._board = None if moves else chess.Board()
+        self._moves = moves
+        self.mode = mode
+        self.player_color = player_color
+        self.difficulty = difficulty
+        self.frame = BoardFrame()
+        self.gid = None
+        # Held by ai_move from the engine search until its move is pushed
+        self.lock = asyncio.Lock()
+
+    @property
+    def board(self) -> chess.Board:
+        if self._board is None:
+            self._board = replay_moves(self._moves)
+            self._moves = None
+        return self._board
+
+    @property
+    def skill(self) -> int:
+        return difficulty_map[self.difficulty]
+
+    @property
+    def limit(self) -> chess.engine.Limit:
+        # The difficulty's budget at the current load
+        return search_controller.limit(self.difficulty)
+
+    @property
+    def perspective(self) -> str:
+        return 'white' if self.player_color == chess.WHITE else 'black'
+
+def _session_key(ctx):
+    return (ctx.channel.id, ctx.author.id)
+
+def _is_ai_turn(ctx, session) -> bool:
+    # Only act if the session is still the live one for this player
+    return (sessions.get(_session_key(ctx)) is session and session.mode == 'ai'
+            and not session.board.is_game_over() and session.board.turn != session.player_color)
+
+def _opponent_id(game, user_id: int) -> int:
+    # Both players share one game dict, so derive the opponent from the colors
+    return game['black'] if user_id == game['white'] else game['white']
+
+class RestoredGame(dict):
+    """A head-to-head game entry rebuilt from packed moves; the board is replayed on first access."""
+
+    def __init__(self, moves: bytes, **fields):
+        super().__init__(**fields)
+        self._moves = moves
+
+    def __missing__(self, key):
+        if key != 'board':
+            raise KeyError(key)
+        board = self['board'] = replay_moves(self._moves)
+        return board
+
+def _restored_game(gid, mode: str, white_id: int, black_id: int, moves: bytes, **extra) -> RestoredGame:
+    # Both players' moves are recorded, so the ply count gives the side to move
+    turn = white_id if len(moves) // 2 % 2 == 0 else black_id
+    return RestoredGame(moves, opponent=black_id, turn=turn, mode=mode, white=white_id, black=black_id,
+                        frame=BoardFrame(), gid=gid, **extra)
+
+class GameStore:
+    """Head-to-head games, reachable from both players' ids, with idle games parked in SQLite.
+
+    At most ``max_games`` games stay in memory. Past that, a background
+    sweep parks the least recently used games that have been idle for
+    ``idle_seconds`` into ``parked_games`` (FEN plus packed moves) and
+    drops their boards; only the two player ids stay in memory. ``get``
+    and friends see resident games only and ``in`` sees both, so handlers
+    ``await fetch(user_id)`` to load a parked game back.
+    """
+
+    def __init__(self, max_games: int = 10000, idle_seconds: float = 600.0, sweep_interval: float = 30.0):
+        self.max_games = max_games
+        self.idle_seconds = idle_seconds
+        self.sweep_interval = sweep_interval
+        self._players = {}
+        # (white, black) -> [game, last used], least recently used first
+        self._lru = OrderedDict()
+        self._parked = {}
+        self._loading = {}
+        self._over = asyncio.Event()
+        self._task = None
+
+    def stats(self) -> dict:
+        return {'resident': len(self._lru), 'parked': len(self._parked) // 2}
+
+    def __contains__(self, user_id):
+        return user_id in self._players or user_id in self._parked
+
+    def get(self, user_id, default=None):
+        key = self._players.get(user_id)
+        if key is None:
+            return default
+        entry = self._lru[key]
+        entry[1] = time.monotonic()
+        self._lru.move_to_end(key)
+        return entry[0]
+
+    def __getitem__(self, user_id):
+        game = self.get(user_id)
+        if game is None:
+            raise KeyError(user_id)
+        return game
+
+    def values(self):
+        return [entry[0] for entry in self._lru.values()]
+
+    def add(self, game):
+        key = (game['white'], game['black'])
+        self._lru[key] = [game, time.monotonic()]
+        self._players[key[0]] = self._players[key[1]] = key
+        if len(self._lru) > self.max_games:
+            self._over.set()
+
+    def remove(self, game):
+        key = (game['white'], game['black'])
+        if self._lru.pop(key, None) is not None:
+            for uid in key:
+                if self._players.get(uid) == key:
+                    del self._players[uid]
+
+    def clear(self):
+        self._players.clear()
+        self._lru.clear()
+        self._parked.clear()
+
+    async def load_index(self):
+        """Remember which players have a parked game (run once at startup)."""
+        for white_id, black_id in await db.fetchall("SELECT white_id, black_id FROM parked_games"):
+            self._parked[white_id] = self._parked[black_id] = (white_id, black_id)
+
+    async def fetch(self, user_id):
+        """Return the player's game, loading it back from the database if it was parked."""
+        game = self.get(user_id)
+        key = self._parked.get(user_id)
+        if game is not None or key is None:
+            return game
+        task = self._loading.get(key)
+        if task is None:
+            task = self._loading[key] = asyncio.ensure_future(self._unpark(key))
+            task.add_done_callback(lambda _: self._loading.pop(key, None))
+        # Shielded: a cancelled caller must not leave the game half loaded
+        await asyncio.shield(task)
+        return self.get(user_id)
+
+    async def _unpark(self, key):
+        row = await db.fetchone(
+            "SELECT mode, tournament_id, match_id, gid, moves FROM parked_games WHERE white_id=? AND black_id=?", key)
+        for uid in key:
+            self._parked.pop(uid, None)
+        if row is None:
+            return
+        mode, t_id, match_id, gid, moves = row
+        extra = {'tournament_id': t_id, 'match_id': match_id} if mode == 'tournament' else {}
+        self.add(_restored_game(gid, mode, key[0], key[1], moves, **extra))
+        await db.execute("DELETE FROM parked_games WHERE white_id=? AND black_id=?", key)
+
+    async def park_idle(self) -> int:
+        """Park idle games beyond ``max_games``; return how many were dropped from memory."""
+        excess = len(self._lru) - self.max_games
+        now = time.monotonic()
+        victims = []
+        for key, (game, used) in self._lru.items():
+            if len(victims) >= excess or now - used < self.idle_seconds:
+                break
+            victims.append((key, game, used))
+        if not victims:
+            return 0
+        rows = []
+        for (white_id, black_id), game, _ in victims:
+            # Boards of restored games that were never touched stay unreplayed here
+            board = dict.get(game, 'board')
+            moves = pack_moves(board.move_stack) if board is not None else game._moves
+            rows.append((white_id, black_id, game['mode'], game.get('tournament_id'), game.get('match_id'),
+                         game.get('gid'), board.fen() if board is not None else None, moves))
+
+        def park_tx(conn):
+            conn.executemany(
+                "INSERT OR REPLACE INTO parked_games(white_id, black_id, mode, tournament_id, match_id, gid, fen, moves, parked_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)",
+                [row[:6] + (row[6] or replay_moves(row[7]).fen(), row[7]) for row in rows])
+        await db.write(park_tx)
+        stale = []
+        for key, game, used in victims:
+            entry = self._lru.get(key)
+            if entry is None or entry[0] is not game or entry[1] != used:
+                # Moved or finished while the write was in flight; keep it resident
+                stale.append(key)
+                continue
+            self.remove(game)
+            self._parked[key[0]] = self._parked[key[1]] = key
+        if stale:
+            await db.write(lambda conn: conn.executemany(
+                "DELETE FROM parked_games WHERE white_id=? AND black_id=?", stale))
+        return len(victims) - len(stale)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._over.wait(), self.sweep_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._over.clear()
+            try:
+                await self.park_idle()
+            except Exception as e:
+                print(f"Failed to park idle games: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+games = GameStore(
+    max_games=int(os.getenv("CHESSBOT_MAX_RESIDENT_GAMES", "10000")),
+    idle_seconds=float(os.getenv("CHESSBOT_GAME_IDLE_SECONDS", "600")),
+)
+sessions = {}
+
+def _new_game(mode: str, white_id: int, black_id: int, **extra) -> dict:
+    """Register a head-to-head game under both players and journal it."""
+    game = {
+        'opponent': black_id,
+        'board': chess.Board(),
+        'turn': white_id,  # White moves first
+        'mode': mode,
+        'white': white_id,
+        'black': black_id,
+        **extra,
+        'frame': BoardFrame(),
+    }
+    game['gid'] = journal.start({'mode': mode, 'white': white_id, 'black': black_id, **extra})
+    games.add(game)
+    return game
+
+def _end_game(game, recorded: bool = False):
+    """Drop a finished game; a ``recorded`` one is ended in the journal by the recorder."""
+    games.remove(game)
+    if not recorded:
+        journal.end(game.get('gid'))
+
+def _open_session(ctx, session):
+    """Make ``session`` the caller's game in this channel, replacing any previous one."""
+    key = _session_key(ctx)
+    old = sessions.get(key)
+    if old is not None:
+        journal.end(old.gid)
+    session.gid = journal.start({'mode': session.mode, 'channel': ctx.channel.id, 'user': ctx.author.id,
+                                 'color': session.player_color, 'difficulty': session.difficulty})
+    sessions[key] = session
+    ponderer.cancel(key)
+
+def _end_session(ctx, session):
+    """Drop a finished or exited solo/AI game if it is still the caller's live one."""
+    key = _session_key(ctx)
+    if sessions.get(key) is session:
+        del sessions[key]
+        journal.end(session.gid)
+        ponderer.cancel(key)
+
+def restore_games(live):
+    """Register the journal's live games; boards are replayed lazily."""
+    finished = 0
+    for gid, meta, moves in live:
+        if 'result' in meta:
+            finished += 1
+            # Finished, but the process stopped before the result was committed
+            board = chess.Board()
+            for move in unpack_moves(moves):
+                board.push(move)
+            recorder.submit(meta['white'], meta['black'], meta['result'], board, gid=gid)
+        elif meta['mode'] in ('solo', 'ai'):
+            session = GameSession(meta['mode'], meta['color'], meta['difficulty'], moves=moves)
+            session.gid = gid
+            sessions[(meta['channel'], meta['user'])] = session
+        elif meta['white'] not in games:
+            # Parked games are loaded from the database when next used
+            games.add(_restored_game(gid, meta.pop('mode'), meta.pop('white'), meta.pop('black'), moves, **meta))
+    if len(live) > finished:
+        print(f"Restored {len(live) - finished} game(s) in progress from the journal")
+    if finished:
+        print(f"Recording {finished} finished game(s) left in the journal")
+
+class Leaderboard:
+    """ELO leaderboard served from memory.
+
+    The top-N rows are cached until a rating changes, and every player's
+    rating is kept in a sorted list so a global rank is a binary search
+    instead of a COUNT(*) scan. ``apply_ratings`` is fed by game
+    finalization after each commit.
+    """
+
+    def __init__(self, top_n: int = 10):
         self.scores = {}
+        self.top_n = top_n
+        self._top = None
+        self._ratings = None
+        self._by_user = {}
+        self._version = 0
 
     def update_score(self, player: discord.User, result: str):
         # Keep legacy in-memory stats for now; persistent ratings handled via DB
@@ -398,27 +2292,54 @@ class Leaderboard:
         elif result == "draw":
             self.scores[player]["draws"] += 1
 
-    def display_leaderboard(self, requester_id=None):
-        # Show top 10 by rating from DB and append requester's global rank if provided
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("SELECT user_id, rating, wins, losses, draws FROM players ORDER BY rating DESC LIMIT 10")
-        rows = c.fetchall()
+    def apply_ratings(self, updates):
+        """Record committed ``(user_id, new_rating)`` changes."""
+        self._version += 1
+        self._top = None
+        if self._ratings is None:
+            return
+        for uid, rating in updates:
+            old = self._by_user.get(uid)
+            if old is not None:
+                del self._ratings[bisect.bisect_left(self._ratings, old)]
+            bisect.insort(self._ratings, rating)
+            self._by_user[uid] = rating
+
+    def rank(self, user_id: int):
+        """Return ``(rank, total, rating)`` for a rated player, else None."""
+        rating = self._by_user.get(user_id)
+        if rating is None:
+            return None
+        # Global rank: 1 + count of players with strictly higher rating
+        higher = len(self._ratings) - bisect.bisect_right(self._ratings, rating)
+        return higher + 1, len(self._ratings), rating
+
+    async def _refresh(self):
+        # Reload if a rating changed while a query was in flight
+        while self._ratings is None or self._top is None:
+            version = self._version
+            if self._ratings is None:
+                rows = await db.fetchall("SELECT user_id, rating FROM players")
+                if version == self._version:
+                    self._by_user = {uid: float(rating) for uid, rating in rows}
+                    self._ratings = sorted(self._by_user.values())
+                continue
+            top = await db.fetchall(
+                "SELECT user_id, rating, wins, losses, draws FROM players ORDER BY rating DESC LIMIT ?",
+                (self.top_n,))
+            if version == self._version:
+                self._top = top
+
+    async def display_leaderboard(self, requester_id=None):
+        # Show top N by rating and append requester's global rank if provided
+        await self._refresh()
+        rows = self._top
         extra = ""
         if requester_id is not None:
-            # Fetch requester rating
-            c.execute("SELECT rating, wins, losses, draws FROM players WHERE user_id=?", (requester_id,))
-            me = c.fetchone()
+            me = self.rank(requester_id)
             if me:
-                my_rating = float(me[0])
-                # Global rank: 1 + count of players with strictly higher rating
-                c.execute("SELECT COUNT(*) FROM players WHERE rating > ?", (my_rating,))
-                higher = c.fetchone()[0]
-                c.execute("SELECT COUNT(*) FROM players")
-                total = c.fetchone()[0]
-                my_rank = higher + 1
+                my_rank, total, my_rating = me
                 extra = f"\nYour rank: {my_rank}/{total} — {my_rating:.0f} ELO"
-        conn.close()
         if not rows:
             return "No scores recorded yet!"
         leaderboard_str = "🏆 ELO Leaderboard 🏆\n"
@@ -426,21 +2347,43 @@ class Leaderboard:
             leaderboard_str += f"{idx}. <@{uid}> — {rating:.0f} ELO | {wins}W-{losses}L-{draws}D\n"
         return leaderboard_str + extra
 
+leaderboard = Leaderboard()
+
 @bot.command(name='leaderboard',aliases=['lb','l'])
 async def show_leaderboard(ctx):
-    leaderboard = Leaderboard()
-    leaderboard_message = leaderboard.display_leaderboard(ctx.author.id)
+    leaderboard_message = await leaderboard.display_leaderboard(ctx.author.id)
     await ctx.send(leaderboard_message)
 
+@bot.command(name='pgn')
+async def pgn_export(ctx, game_id: int = None):
+    if game_id is None:
+        # Default to the requester's most recent recorded game
+        row = await db.fetchone(
+            "SELECT id FROM games WHERE white_id=? OR black_id=? ORDER BY id DESC LIMIT 1",
+            (ctx.author.id, ctx.author.id))
+        if not row:
+            await ctx.send("No recorded games found for you.")
+            return
+        game_id = row[0]
+    pgn_str = await export_pgn(game_id)
+    if pgn_str is None:
+        await ctx.send(f"Game #{game_id} not found.")
+        return
+    await ctx.send(f"PGN for game #{game_id}:",
+                   file=discord.File(BytesIO(pgn_str.encode()), filename=f"game-{game_id}.pgn"))
+
 @bot.command(name='resign')
 async def resign(ctx):
-    game = games.pop(ctx.author.id, None)
+    game = await games.fetch(ctx.author.id)
 
     if not game:
         await ctx.send("You're not in a game!")
         return
 
-    opponent = bot.get_user(game['opponent'])
+    opponent_id = _opponent_id(game, ctx.author.id)
+    opponent = bot.get_user(opponent_id)
+    # Clear before advancing so the opponent's next-round game is not dropped
+    _end_game(game, recorded=True)
     # ELO update only for 1v1 games
     if game.get('mode') == '1v1':
         white_id = game['white']
@@ -449,8 +2392,7 @@ async def resign(ctx):
             result = '0-1'
         else:
             result = '1-0'
-        update_elo(white_id, black_id, result)
-        record_game(white_id, black_id, result, game['board'])
+        recorder.submit(white_id, black_id, result, game['board'], gid=game.get('gid'))
     elif game.get('mode') == 'tournament':
         white_id = game['white']
         black_id = game['black']
@@ -460,43 +2402,35 @@ async def resign(ctx):
         else:
             result = '1-0'
             winner_id = white_id
-        update_elo(white_id, black_id, result)
-        record_game(white_id, black_id, result, game['board'])
-        _complete_tournament_match_and_advance(ctx, game['tournament_id'], game['match_id'], winner_id)
-    games.pop(opponent.id, None)
+        recorder.submit(white_id, black_id, result, game['board'], gid=game.get('gid'))
+        await _complete_tournament_match_and_advance(ctx, game['tournament_id'], game['match_id'], winner_id, result)
 
     await ctx.send(
         f"{ctx.author.mention} has resigned. {opponent.mention} wins!")
 
 async def start_solo_game(ctx):
-    global player_color, current_turn, mode
-    board.reset()
-    player_color = chess.WHITE
-    current_turn = chess.WHITE
-    mode = 'solo'
+    session = GameSession('solo', chess.WHITE)
+    _open_session(ctx, session)
 
-    generate_board_image(board, perspective='white')
     await ctx.send("New chess game started in `Solo` mode! You are `white`.",
-                   file=discord.File("chessboard.png"))
+                   file=await board_file(session.board, perspective='white', frame=session.frame))
     await ctx.send("It's your turn to move! Use `!move <uci>` (e.g., `!move e2e4`)."
                    )
 
 async def start_ai_game(ctx):
-    global player_color, current_turn, mode
-    board.reset()
-    player_color = random.choice([chess.WHITE, chess.BLACK])
-    current_turn = chess.WHITE
-    mode = 'ai'
-
-    color_text = "white" if player_color == chess.WHITE else "black"
-    generate_board_image(board, perspective=color_text)
+    session = GameSession('ai', random.choice([chess.WHITE, chess.BLACK]))
+    _open_session(ctx, session)
+
+    color_text = session.perspective
     await ctx.send(
         f"New chess game started in `AI` mode! You are `{color_text}`.",
-        file=discord.File("chessboard.png"))
+        file=await board_file(session.board, perspective=color_text, frame=session.frame))
 
-    await choose_difficulty(ctx)
-    if player_color == chess.BLACK:
+    await choose_difficulty(ctx, session)
+    if session.player_color == chess.BLACK:
         await ai_move(ctx)
+    else:
+        ponderer.start(_session_key(ctx), session.board, session.skill, session.limit)
 
 @bot.command(name='start_ai', aliases=['play_ai', 'ai_game'])
 async def cmd_start_ai(ctx):
@@ -521,9 +2455,8 @@ async def challenge(ctx, opponent: discord.Member):
         await ctx.send("One of the players is already in a game!")
         return
 
-    # Prepare game state but do not activate until accepted
-    local_board = chess.Board()
-    challenge_msg = await ctx.send(
+    # Sent immediately: the reaction check needs the message
+    challenge_msg = await ctx.send_now(
         f"{ctx.author.mention} has challenged {opponent.mention} to a 1v1 chess match! React with ✅ to accept.")
     try:
         await challenge_msg.add_reaction('✅')
@@ -541,90 +2474,81 @@ async def challenge(ctx, opponent: discord.Member):
         await ctx.send(f"{opponent.mention} did not respond in time. Challenge expired.")
         return
 
-    # Set up mirrored game entries for both players
-    games[ctx.author.id] = {
-        'opponent': opponent.id,
-        'board': local_board,
-        'turn': ctx.author.id,  # Challenger (White) moves first
-        'mode': '1v1',
-        'white': ctx.author.id,
-        'black': opponent.id,
-    }
-    games[opponent.id] = games[ctx.author.id]
+    # One game entry shared by both players; the challenger is White
+    game = _new_game('1v1', ctx.author.id, opponent.id)
 
-    generate_board_image(local_board, perspective='white')
     await ctx.send(
         f"{opponent.mention} accepted the challenge! {ctx.author.mention} is White and moves first. Use `!move <uci>` (e.g., `!move e2e4`).",
-        file=discord.File("chessboard.png")
+        file=await board_file(game['board'], perspective='white', frame=game['frame'])
     )
 
 @bot.command(name='move', aliases=['mv','m'])
 async def make_move(ctx, move: str):
-    global board, current_turn
-
     # If user is in an active head-to-head game (1v1 or tournament), prioritize that
-    if ctx.author.id in games:
-        game = games.get(ctx.author.id)
-        if not game:
-            await ctx.send("You're not in a game!")
-            return
-
+    game = await games.fetch(ctx.author.id)
+    session = None
+    if game:
         if game['turn'] != ctx.author.id:
             await ctx.send(
                 "It's not your turn yet. Please wait for the other player to move."
             )
             return
-
         board = game['board']
-
-    elif mode in ('solo', 'ai') and current_turn != player_color:
-        await ctx.send(
-            "It's not your turn yet. Please wait for the other player to move."
-        )
-        return
-    elif mode not in ('solo', 'ai'):
-        # Not in solo/ai and not in games -> no active game
-        await ctx.send("You're not in a game. Use `/play` or `/challenge @user`.")
-        return
+        mode = game['mode']
+        perspective = 'white'
+        frame = game['frame']
+        gid = game.get('gid')
+    else:
+        session = sessions.get(_session_key(ctx))
+        if session is None:
+            await ctx.send("You're not in a game. Use `/play` or `/challenge @user`.")
+            return
+        board = session.board
+        mode = session.mode
+        perspective = session.perspective
+        frame = session.frame
+        gid = session.gid
+        ponderer.cancel(_session_key(ctx))
+        # Solo players move for both sides; AI games only on the player's turn
+        if mode == 'ai' and board.turn != session.player_color:
+            await ctx.send(
+                "It's not your turn yet. Please wait for the other player to move."
+            )
+            return
 
     try:
         move_obj = chess.Move.from_uci(move)
         if move_obj in board.legal_moves:
             board.push(move_obj)
-
-            current_turn = chess.BLACK if current_turn == chess.WHITE else chess.WHITE
-            perspective = 'white' if player_color == chess.WHITE else 'black'
-            generate_board_image(board, perspective=perspective)
+            journal.move(gid, move_obj)
+            if game:
+                # Hand over the turn before awaiting the render, so a second !move cannot slip in
+                game['turn'] = _opponent_id(game, ctx.author.id)
 
             await ctx.send(f"Move `{move}` accepted.",
-                           file=discord.File("chessboard.png"))
+                           file=await board_file(board, perspective=perspective, frame=frame))
             if board.is_checkmate():
                 await ctx.send("Checkmate! Game over.")
                 if mode == '1v1':
                     # Determine result: after push, side to move is checkmated
                     white_id = game['white']
                     black_id = game['black']
-                    loser_is_white = (current_turn == chess.WHITE)
+                    loser_is_white = (board.turn == chess.WHITE)
                     result = '0-1' if loser_is_white else '1-0'
-                    update_elo(white_id, black_id, result)
-                    record_game(white_id, black_id, result, board)
-                    game = games.pop(ctx.author.id, None)
-                    if game:
-                        opponent = bot.get_user(game['opponent'])
-                        games.pop(opponent.id, None)
+                    recorder.submit(white_id, black_id, result, board, gid=game.get('gid'))
+                    _end_game(game, recorded=True)
                 elif mode == 'tournament':
                     white_id = game['white']
                     black_id = game['black']
-                    loser_is_white = (current_turn == chess.WHITE)
+                    loser_is_white = (board.turn == chess.WHITE)
                     result = '0-1' if loser_is_white else '1-0'
                     winner_id = black_id if loser_is_white else white_id
-                    update_elo(white_id, black_id, result)
-                    record_game(white_id, black_id, result, board)
-                    _complete_tournament_match_and_advance(ctx, game['tournament_id'], game['match_id'], winner_id)
-                    game = games.pop(ctx.author.id, None)
-                    if game:
-                        opponent = bot.get_user(game['opponent'])
-                        games.pop(opponent.id, None)
+                    recorder.submit(white_id, black_id, result, board, gid=game.get('gid'))
+                    # Clear before advancing so the next round's games are not dropped
+                    _end_game(game, recorded=True)
+                    await _complete_tournament_match_and_advance(ctx, game['tournament_id'], game['match_id'], winner_id, result)
+                else:
+                    _end_session(ctx, session)
                 return
             elif board.is_stalemate() or board.is_insufficient_material(
             ) or board.is_seventyfive_moves() or board.is_fivefold_repetition(
@@ -635,51 +2559,36 @@ async def make_move(ctx, move: str):
                 if mode == '1v1':
                     white_id = game['white']
                     black_id = game['black']
-                    update_elo(white_id, black_id, '1/2-1/2')
-                    record_game(white_id, black_id, '1/2-1/2', board)
-                    game = games.pop(ctx.author.id, None)
-                    if game:
-                        opponent = bot.get_user(game['opponent'])
-                        games.pop(opponent.id, None)
+                    recorder.submit(white_id, black_id, '1/2-1/2', board, gid=game.get('gid'))
+                    _end_game(game, recorded=True)
                 elif mode == 'tournament':
                     white_id = game['white']
                     black_id = game['black']
-                    update_elo(white_id, black_id, '1/2-1/2')
-                    record_game(white_id, black_id, '1/2-1/2', board)
+                    recorder.submit(white_id, black_id, '1/2-1/2', board, gid=game.get('gid'))
+                    # Clear active game states for both players
+                    _end_game(game, recorded=True)
                     # Check if this match was already a tiebreak
-                    info = _get_match_info(game['match_id'])
+                    info = await _get_match_info(game['match_id'])
                     t_id = game['tournament_id']
-                    if info and not info['is_tiebreak']:
+                    if info and info['format'] == 'swiss':
+                        # Swiss rounds score draws as half a point each
+                        await _complete_tournament_match_and_advance(ctx, t_id, game['match_id'], None, '1/2-1/2')
+                    elif info and not info['is_tiebreak']:
                         # Mark current match done (draw) and start a tiebreak with swapped colors
-                        conn_tb = sqlite3.connect(DB_PATH)
-                        c_tb = conn_tb.cursor()
-                        c_tb.execute("UPDATE tournament_matches SET status='done' WHERE id=?", (game['match_id'],))
-                        conn_tb.commit()
-                        conn_tb.close()
-                        await ctx.send("Starting a tiebreak game with swapped colors due to draw.")
-                        _create_tiebreak_match_and_start(ctx, t_id, info['round'], black_id, white_id)
+                        await _create_tiebreak_match_and_start(ctx, t_id, game['match_id'], info['round'], black_id, white_id)
                     else:
                         # Tiebreak also drawn -> randomly advance
                         winner_id = random.choice([white_id, black_id])
                         await ctx.send(f"Tiebreak draw resolved randomly: <@{winner_id}> advances.")
-                        _complete_tournament_match_and_advance(ctx, t_id, game['match_id'], winner_id)
-                    # Clear active game states for both players
-                    game = games.pop(ctx.author.id, None)
-                    if game:
-                        opponent = bot.get_user(game['opponent'])
-                        games.pop(opponent.id, None)
+                        await _complete_tournament_match_and_advance(ctx, t_id, game['match_id'], winner_id, '1/2-1/2')
+                else:
+                    _end_session(ctx, session)
                 return
 
-            if mode == 'ai' and current_turn != player_color and not board.is_game_over(
-            ):
+            if session is not None and _is_ai_turn(ctx, session):
                 await ai_move(ctx)
             elif mode == '1v1' or mode == 'tournament':
-                opponent_id = game['opponent']
-                games[opponent_id]['board'] = board
-                games[opponent_id]['turn'] = current_turn
-                games[ctx.author.id] = games[opponent_id]
-
-                opponent = bot.get_user(opponent_id)
+                opponent = bot.get_user(game['turn'])
                 await ctx.send(
                     f"Move `{move}` accepted. It's now {opponent.mention}'s turn."
                 )
@@ -691,26 +2600,40 @@ async def make_move(ctx, move: str):
 
 @bot.command(name='ai', aliases=['a'])
 async def ai_move(ctx):
-    global current_turn
+    session = sessions.get(_session_key(ctx))
+    if session is None:
+        await ctx.send("You're not in a solo or AI game.")
+        return
+    board = session.board
 
     if board.is_game_over():
+        _end_session(ctx, session)
         await ctx.send("Game over!")
         return
+    # Overlapping calls (a difficulty click during the opening move, !ai sent
+    # twice) must not both push: only the first for this position moves
+    ply = len(board.move_stack)
     try:
-
-        stockfish.set_fen_position(board.fen())
-        best_move = stockfish.get_best_move()
-        board.push_uci(best_move)
-        current_turn = chess.BLACK if current_turn == chess.WHITE else chess.WHITE
-        perspective = 'white' if player_color == chess.WHITE else 'black'
-        generate_board_image(board, perspective=perspective)
-        await ctx.send(f"Stockfish plays `{best_move}`.",
-                       file=discord.File("chessboard.png"))
+        async with session.lock:
+            if len(board.move_stack) != ply:
+                return
+            engine_move = await best_move(board, skill=session.skill, limit=session.limit)
+            if (len(board.move_stack) != ply or engine_move not in board.legal_moves
+                    or sessions.get(_session_key(ctx)) is not session):
+                # The position changed or the game was left during the search
+                return
+            board.push(engine_move)
+            journal.move(session.gid, engine_move)
+        await ctx.send(f"Stockfish plays `{engine_move}`.",
+                       file=await board_file(board, perspective=session.perspective, frame=session.frame))
 
         if board.is_game_over():
+            _end_session(ctx, session)
             await ctx.send("Game over!")
         else:
-            if current_turn == player_color:
+            if board.turn == session.player_color:
+                if session.mode == 'ai':
+                    ponderer.start(_session_key(ctx), board, session.skill, session.limit)
                 await ctx.send(
                     f"It's your turn to move! Use `!move <move>` to make a move."
                 )
@@ -723,12 +2646,17 @@ async def ai_move(ctx):
 # Command to provide a hint for the next move
 @bot.command(name='hint', aliases=['h'])
 async def provide_hint(ctx):
+    # Solo/AI games only: no engine help in rated head-to-head games
+    session = sessions.get(_session_key(ctx))
+    if session is None:
+        await ctx.send("You're not in a solo or AI game.")
+        return
+    board = session.board
     if board.is_game_over():
         await ctx.send("Game over!")
         return
     try:
-        stockfish.set_fen_position(board.fen())
-        hint_move = stockfish.get_best_move()
+        hint_move = await best_move(board, skill=session.skill, limit=session.limit)
         await ctx.send(f"Hint: The best move is `{hint_move}`.")
     except Exception as e:
         await ctx.send(f"Error with hint: {e}")
@@ -737,15 +2665,7 @@ async def provide_hint(ctx):
 # Tournament Functionality #
 ###########################
 
-def _get_tournament_players(t_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT user_id FROM tournament_players WHERE tournament_id=?", (t_id,))
-    rows = [r[0] for r in c.fetchall()]
-    conn.close()
-    return rows
-
-def _create_matches_for_round(t_id: int, round_no: int, players: list[int]):
+def _pair_randomly(players: list[int]):
     pairs = []
     shuffled = players[:]
     random.shuffle(shuffled)
@@ -755,70 +2675,260 @@ def _create_matches_for_round(t_id: int, round_no: int, players: list[int]):
         bye = shuffled.pop()
     for i in range(0, len(shuffled), 2):
         pairs.append((shuffled[i], shuffled[i+1]))
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    for w, b in pairs:
-        c.execute("INSERT INTO tournament_matches(tournament_id, round, white_id, black_id, winner_id, status) VALUES (?, ?, ?, ?, NULL, 'pending')",
-                  (t_id, round_no, w, b))
+    return pairs, bye
+
+def _create_round_tx(c, t_id: int, round_no: int, players: list[int]):
+    return _insert_round_tx(c, t_id, round_no, *_pair_randomly(players))
+
+def _insert_round_tx(c, t_id: int, round_no: int, pairs, bye):
+    """Insert a round's matches and mark them ongoing in a few set-based statements.
+
+    Returns the ``(id, white_id, black_id)`` rows of the started matches.
+    """
+    c.executemany("INSERT INTO tournament_matches(tournament_id, round, white_id, black_id, winner_id, status) VALUES (?, ?, ?, ?, NULL, 'pending')",
+                  [(t_id, round_no, w, b) for w, b in pairs])
     if bye is not None:
         # Create a dummy match with bye winner
         c.execute("INSERT INTO tournament_matches(tournament_id, round, white_id, black_id, winner_id, status) VALUES (?, ?, ?, ?, ?, 'done')",
                   (t_id, round_no, bye, None, bye))
-    conn.commit()
-    conn.close()
-
-def _all_round_done(t_id: int, round_no: int) -> bool:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT COUNT(*) FROM tournament_matches WHERE tournament_id=? AND round=? AND status!='done'", (t_id, round_no))
-    remaining = c.fetchone()[0]
-    conn.close()
-    return remaining == 0
-
-def _get_current_round(t_id: int) -> int:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT MAX(round) FROM tournament_matches WHERE tournament_id=?", (t_id,))
-    row = c.fetchone()
-    conn.close()
-    return row[0] if row and row[0] is not None else 0
-
-def _winners_of_round(t_id: int, round_no: int) -> list[int]:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT winner_id FROM tournament_matches WHERE tournament_id=? AND round=? AND winner_id IS NOT NULL", (t_id, round_no))
-    rows = [r[0] for r in c.fetchall()]
-    conn.close()
-    return rows
-
-def _start_pending_matches_in_round(ctx, t_id: int, round_no: int):
-
-    # Start all pending matches sequentially (players play matches when they use /move; we set up games state)
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
     c.execute("SELECT id, white_id, black_id FROM tournament_matches WHERE tournament_id=? AND round=? AND status='pending'", (t_id, round_no))
     matches = c.fetchall()
-    # Mark as ongoing
+    c.execute("UPDATE tournament_matches SET status='ongoing' WHERE tournament_id=? AND round=? AND status='pending'", (t_id, round_no))
+    return matches
+
+class SwissPlayer:
+    """One entrant's standing, as needed to pair a Swiss round."""
+
+    __slots__ = ('user_id', 'rating', 'score', 'opponents', 'color_balance', 'last_color', 'had_bye')
+
+    def __init__(self, user_id: int, rating: float = 1200.0):
+        self.user_id = user_id
+        self.rating = rating
+        self.score = 0.0
+        self.opponents = set()
+        self.color_balance = 0  # games as White minus games as Black
+        self.last_color = None
+        self.had_bye = False
+
+def record_swiss_result(white: SwissPlayer, black: SwissPlayer | None, result: str | None):
+    """Apply a finished game to both standings; ``black`` is None for a bye."""
+    if black is None:
+        white.score += 1.0
+        white.had_bye = True
+        return
+    s_w, s_b = RESULT_SCORES.get(result, (0.5, 0.5))
+    white.score += s_w
+    black.score += s_b
+    white.opponents.add(black.user_id)
+    black.opponents.add(white.user_id)
+    white.color_balance += 1
+    black.color_balance -= 1
+    white.last_color = chess.WHITE
+    black.last_color = chess.BLACK
+
+def _color_due(p: SwissPlayer) -> int:
+    # +1 if due White, -1 if due Black, 0 if either is fine
+    if p.color_balance:
+        return -1 if p.color_balance > 0 else 1
+    if p.last_color is None:
+        return 0
+    return 1 if p.last_color == chess.BLACK else -1
+
+def _color_clash(a: SwissPlayer, b: SwissPlayer) -> int:
+    # 0: compatible, 1: one player repeats a colour, 2: either would pass a colour difference of 2
+    due = _color_due(a)
+    if not due or due != _color_due(b):
+        return 0
+    white_id, _ = _color_pair(a, b)
+    for p in (a, b):
+        if abs(p.color_balance + (1 if p.user_id == white_id else -1)) > 2:
+            return 2
+    return 1
+
+def _color_pair(a: SwissPlayer, b: SwissPlayer, board: int = 0):
+    # Give each player their due colour; when both are due the same one, the
+    # player further out of balance gets it and the higher ranked breaks ties.
+    # With neither due (round one), colours alternate from board to board
+    due_a, due_b = _color_due(a), _color_due(b)
+    if due_a and (due_a != due_b or abs(a.color_balance) >= abs(b.color_balance)):
+        a_white = due_a > 0
+    elif due_b:
+        a_white = due_b < 0
+    else:
+        a_white = board % 2 == 0
+    return (a.user_id, b.user_id) if a_white else (b.user_id, a.user_id)
+
+# How many eligible opponents to look at when searching for a colour match
+SWISS_COLOR_WINDOW = 12
+
+def _pair_score_group(group, pairs, allow_rematch: bool):
+    """Pair the top half of a group against the bottom half; return who is left."""
+    top, bottom = group[:len(group) // 2], group[len(group) // 2:]
+    taken = set()
+    start = 0
+    for p in top:
+        if p.user_id in taken:
+            continue
+        while start < len(bottom) and bottom[start].user_id in taken:
+            start += 1
+        # Nearest eligible opponent with the least colour conflict
+        eligible = list(itertools.islice(
+            (q for q in itertools.islice(bottom, start, None)
+             if q.user_id not in taken and q.user_id not in p.opponents),
+            SWISS_COLOR_WINDOW))
+        partner = min(eligible, key=lambda q: _color_clash(p, q)) if eligible else None
+        if partner is None or _color_clash(p, partner) == 2:
+            # Look through the rest of the group before breaking the colour limit
+            partner = next((q for q in itertools.chain(itertools.islice(bottom, start, None), top)
+                            if q is not p and q.user_id not in taken and q.user_id not in p.opponents
+                            and _color_clash(p, q) < 2), None)
+        if partner is None:
+            # Floats down to the next score group
+            continue
+        taken.add(p.user_id)
+        taken.add(partner.user_id)
+        pairs.append(_color_pair(p, partner, len(pairs)))
+    leftover = [p for p in group if p.user_id not in taken]
+    if allow_rematch:
+        # Nobody below to float to: pair everyone, and let _repair_pairs swap
+        # out any rematch or colour-limit break this leaves
+        while len(leftover) > 1:
+            p = leftover.pop(0)
+            partner = min(leftover, key=lambda q: (q.user_id in p.opponents, _color_clash(p, q)))
+            leftover.remove(partner)
+            pairs.append(_color_pair(p, partner, len(pairs)))
+        return []
+    return leftover
+
+def _pair_allowed(a: SwissPlayer, b: SwissPlayer) -> bool:
+    return b.user_id not in a.opponents and _color_clash(a, b) < 2
+
+def _repair_pairs(pairs, by_id):
+    """Swap partners between pairs to undo rematches and colour-limit breaks.
+
+    The greedy pass never backtracks, so its last players can be left with
+    only a rematch or a third colour in a row. For each such pair, try the
+    other pairs closest in score and exchange partners when both new pairs
+    are allowed. A break no single swap can remove is kept.
+    """
+    for i, (w, b) in enumerate(pairs):
+        x, y = by_id[w], by_id[b]
+        if _pair_allowed(x, y):
+            continue
+        score = x.score + y.score
+        order = sorted((j for j in range(len(pairs)) if j != i),
+                       key=lambda j: abs(by_id[pairs[j][0]].score + by_id[pairs[j][1]].score - score))
+        for j in order:
+            a, c = by_id[pairs[j][0]], by_id[pairs[j][1]]
+            swap = next((((p1, q1), (p2, q2)) for (p1, q1), (p2, q2) in (((x, a), (y, c)), ((x, c), (y, a)))
+                         if _pair_allowed(p1, q1) and _pair_allowed(p2, q2)), None)
+            if swap is not None:
+                (p1, q1), (p2, q2) = swap
+                pairs[i], pairs[j] = _color_pair(p1, q1, i), _color_pair(p2, q2, j)
+                break
+    return pairs
+
+# Fields up to this size are re-paired exhaustively when swaps leave a break
+SWISS_EXACT_LIMIT = 32
+
+def _search_pairs(players: list[SwissPlayer], budget: int = 20000):
+    """Backtracking pairing in rank order with no rematch or colour-limit break; None if none is found."""
+    pairs = []
+    left = list(players)
+    nodes = 0
+
+    def solve() -> bool:
+        nonlocal nodes
+        if not left:
+            return True
+        p = left.pop(0)
+        for k, q in enumerate(left):
+            nodes += 1
+            if nodes > budget:
+                break
+            if _pair_allowed(p, q):
+                left.pop(k)
+                pairs.append(_color_pair(p, q, len(pairs)))
+                if solve():
+                    return True
+                pairs.pop()
+                left.insert(k, q)
+        left.insert(0, p)
+        return False
+
+    return pairs if solve() else None
+
+def swiss_pair(players: list[SwissPlayer]):
+    """Pair one Swiss round.
+
+    Players are ranked by score, then rating, and paired inside their score
+    group, top half against bottom half, avoiding rematches and colour
+    differences beyond 2. Anyone who cannot be paired floats down to the
+    next group; what the last group cannot place is fixed up by swapping
+    partners with nearby pairs, and only kept when no swap helps. With an
+    odd field, the lowest-ranked player without a bye gets one. Small
+    fields that still break a rule are re-paired by a bounded search, which
+    may also move the bye. Runs in roughly O(n log n + n * rounds). Returns ``(pairs, bye)`` with pairs as
+    ``(white_id, black_id)`` and bye a user id or None.
+    """
+    ranked = sorted(players, key=lambda p: (-p.score, -p.rating, p.user_id))
+    bye = None
+    if len(ranked) % 2:
+        idx = next((i for i in range(len(ranked) - 1, -1, -1) if not ranked[i].had_bye), len(ranked) - 1)
+        bye = ranked.pop(idx).user_id
+    pairs = []
+    floaters = []
+    i, n = 0, len(ranked)
+    while i < n:
+        j = i
+        while j < n and ranked[j].score == ranked[i].score:
+            j += 1
+        floaters = _pair_score_group(floaters + ranked[i:j], pairs, allow_rematch=(j == n))
+        i = j
+    by_id = {p.user_id: p for p in players}
+    pairs = _repair_pairs(pairs, by_id)
+    if len(players) <= SWISS_EXACT_LIMIT and not all(_pair_allowed(by_id[w], by_id[b]) for w, b in pairs):
+        everyone = sorted(players, key=lambda p: (-p.score, -p.rating, p.user_id))
+        if len(everyone) % 2:
+            # Preferred bye first, then other players who have not had one, lowest ranked first
+            byes = [by_id[bye]] + [p for p in reversed(everyone) if not p.had_bye and p.user_id != bye]
+        else:
+            byes = [None]
+        for sitting_out in byes:
+            exact = _search_pairs([p for p in everyone if p is not sitting_out])
+            if exact is not None:
+                return exact, sitting_out.user_id if sitting_out is not None else None
+    return pairs, bye
+
+def _swiss_standings_tx(c, t_id: int) -> list[SwissPlayer]:
+    c.execute(
+        "SELECT tp.user_id, COALESCE(p.rating, 1200.0) FROM tournament_players tp "
+        "LEFT JOIN players p ON p.user_id = tp.user_id WHERE tp.tournament_id=?", (t_id,))
+    players = {uid: SwissPlayer(uid, float(rating)) for uid, rating in c.fetchall()}
+    c.execute("SELECT white_id, black_id, result FROM tournament_matches WHERE tournament_id=? AND status='done' ORDER BY round, id", (t_id,))
+    for w, b, result in c.fetchall():
+        if w in players:
+            record_swiss_result(players[w], players.get(b), result)
+    return list(players.values())
+
+def _create_swiss_round_tx(c, t_id: int, round_no: int):
+    return _insert_round_tx(c, t_id, round_no, *swiss_pair(_swiss_standings_tx(c, t_id)))
+
+async def _start_round_games(ctx, t_id: int, round_no: int, matches):
+    # Players play matches when they use /move; we only set up games state
     for mid, w, b in matches:
-        c.execute("UPDATE tournament_matches SET status='ongoing' WHERE id=?", (mid,))
         # Set up a game for both players
-        local_board = chess.Board()
-        games[w] = {'opponent': b, 'board': local_board, 'turn': w, 'mode': 'tournament', 'white': w, 'black': b, 'tournament_id': t_id, 'match_id': mid}
-        games[b] = games[w]
-    conn.commit()
-    conn.close()
+        _new_game('tournament', w, b, tournament_id=t_id, match_id=mid)
     if matches:
         lines = [f"Starting Round {round_no} matches:"]
         for mid, w, b in matches:
             lines.append(f"Match #{mid}: <@{w}> (White) vs <@{b}> (Black) — White to move. Use `!move <uci>`")
-        asyncio.create_task(ctx.send("\n".join(lines)))
+        await ctx.send("\n".join(lines))
 
-def _get_match_info(match_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT round, white_id, black_id, is_tiebreak, tournament_id FROM tournament_matches WHERE id=?", (match_id,))
-    row = c.fetchone()
-    conn.close()
+async def _get_match_info(match_id: int):
+    row = await db.fetchone(
+        "SELECT m.round, m.white_id, m.black_id, m.is_tiebreak, m.tournament_id, t.format "
+        "FROM tournament_matches m LEFT JOIN tournaments t ON t.id = m.tournament_id WHERE m.id=?", (match_id,))
     if not row:
         return None
     return {
@@ -826,68 +2936,75 @@ def _get_match_info(match_id: int):
         'white': row[1],
         'black': row[2],
         'is_tiebreak': int(row[3]) if row[3] is not None else 0,
-        'tournament_id': row[4]
+        'tournament_id': row[4],
+        'format': row[5] or 'elimination',
     }
 
-def _create_tiebreak_match_and_start(ctx, t_id: int, round_no: int, white_id: int, black_id: int):
-    # Create tiebreak match with immediate start (status ongoing) and set up games
-    conn = sqlite3.connect(DB_PATH)
+def _tiebreak_tx(conn, t_id: int, drawn_id: int, round_no: int, white_id: int, black_id: int) -> int:
+    # One transaction, so the round never looks complete between the draw and its tiebreak
     c = conn.cursor()
+    c.execute("UPDATE tournament_matches SET status='done' WHERE id=?", (drawn_id,))
     c.execute(
         "INSERT INTO tournament_matches(tournament_id, round, white_id, black_id, winner_id, status, is_tiebreak) VALUES (?, ?, ?, ?, NULL, 'ongoing', 1)",
         (t_id, round_no, white_id, black_id)
     )
-    match_id = c.lastrowid
-    conn.commit()
-    conn.close()
-    local_board = chess.Board()
-    games[white_id] = {
-        'opponent': black_id,
-        'board': local_board,
-        'turn': white_id,
-        'mode': 'tournament',
-        'white': white_id,
-        'black': black_id,
-        'tournament_id': t_id,
-        'match_id': match_id
-    }
-    games[black_id] = games[white_id]
-    asyncio.create_task(ctx.send(f"Tiebreak started: Match #{match_id} (TB) — <@{white_id}> (White) vs <@{black_id}> (Black). White to move."))
-
-def _complete_tournament_match_and_advance(ctx, t_id: int, match_id: int, winner_id: int):
-    # Mark match done and set winner
-    conn = sqlite3.connect(DB_PATH)
+    return c.lastrowid
+
+async def _create_tiebreak_match_and_start(ctx, t_id: int, drawn_id: int, round_no: int, white_id: int, black_id: int):
+    # Close the drawn match and create the tiebreak with immediate start (status ongoing)
+    match_id = await db.write(_tiebreak_tx, t_id, drawn_id, round_no, white_id, black_id)
+    await ctx.send("Starting a tiebreak game with swapped colors due to draw.")
+    _new_game('tournament', white_id, black_id, tournament_id=t_id, match_id=match_id)
+    await ctx.send(f"Tiebreak started: Match #{match_id} (TB) — <@{white_id}> (White) vs <@{black_id}> (Black). White to move.")
+
+def _complete_match_tx(conn, t_id: int, match_id: int, winner_id: int | None, result: str | None):
+    """Finish a match and, if it closed its round, finish or advance the tournament.
+
+    Returns ``(round_no, winners, next_matches)``: winners is None while the
+    round is still running, and next_matches is None when the tournament ended.
+    For Swiss events the tournament winner is the leader on score.
+    """
     c = conn.cursor()
-    c.execute("UPDATE tournament_matches SET winner_id=?, status='done' WHERE id=?", (winner_id, match_id))
-    conn.commit()
+    # Mark match done and set winner
+    c.execute("UPDATE tournament_matches SET winner_id=?, result=?, status='done' WHERE id=?", (winner_id, result, match_id))
     # Determine current round
     c.execute("SELECT round FROM tournament_matches WHERE id=?", (match_id,))
     row = c.fetchone()
     round_no = row[0] if row else 1
-    conn.close()
-    # If all matches in round done, create next round or finish
-    if _all_round_done(t_id, round_no):
-        winners = _winners_of_round(t_id, round_no)
-        if len(winners) <= 1:
-            # Tournament finished
-            asyncio.create_task(ctx.send(f"🏆 Tournament #{t_id} winner: <@{winners[0]}>!"))
-            conn2 = sqlite3.connect(DB_PATH)
-            c2 = conn2.cursor()
-            c2.execute("UPDATE tournaments SET status='finished' WHERE id=?", (t_id,))
-            conn2.commit()
-            conn2.close()
-        else:
-            next_round = round_no + 1
-            _create_matches_for_round(t_id, next_round, winners)
-            asyncio.create_task(ctx.send(f"All matches in Round {round_no} completed. Creating Round {next_round}..."))
-            _start_pending_matches_in_round(ctx, t_id, next_round)
+    c.execute("SELECT COUNT(*) FROM tournament_matches WHERE tournament_id=? AND round=? AND status!='done'", (t_id, round_no))
+    if c.fetchone()[0]:
+        return round_no, None, None
+    c.execute("SELECT format, rounds FROM tournaments WHERE id=?", (t_id,))
+    fmt, rounds = c.fetchone() or ('elimination', None)
+    if fmt == 'swiss':
+        if round_no < (rounds or 0):
+            return round_no, [], _create_swiss_round_tx(c, t_id, round_no + 1)
+        standings = _swiss_standings_tx(c, t_id)
+        leader = max(standings, key=lambda p: (p.score, p.rating))
+        c.execute("UPDATE tournaments SET status='finished' WHERE id=?", (t_id,))
+        return round_no, [leader.user_id], None
+    c.execute("SELECT winner_id FROM tournament_matches WHERE tournament_id=? AND round=? AND winner_id IS NOT NULL", (t_id, round_no))
+    winners = [r[0] for r in c.fetchall()]
+    if len(winners) <= 1:
+        c.execute("UPDATE tournaments SET status='finished' WHERE id=?", (t_id,))
+        return round_no, winners, None
+    return round_no, winners, _create_round_tx(c, t_id, round_no + 1, winners)
+
+async def _complete_tournament_match_and_advance(ctx, t_id: int, match_id: int, winner_id: int | None, result: str | None = None):
+    # One transaction: finish the match, then finish the tournament or create the next round
+    round_no, winners, next_matches = await db.write(_complete_match_tx, t_id, match_id, winner_id, result)
+    if winners is None:
+        return
+    if next_matches is None:
+        # Tournament finished
+        await ctx.send(f"🏆 Tournament #{t_id} winner: <@{winners[0]}>!")
+    else:
+        next_round = round_no + 1
+        await ctx.send(f"All matches in Round {round_no} completed. Creating Round {next_round}...")
+        await _start_round_games(ctx, t_id, next_round, next_matches)
 
-def _bracket_text(t_id: int) -> str:
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT round, id, white_id, black_id, winner_id, status, is_tiebreak FROM tournament_matches WHERE tournament_id=? ORDER BY round, id", (t_id,))
-    rows = c.fetchall()
-    conn.close()
+async def _bracket_text(t_id: int) -> str:
+    rows = await db.fetchall("SELECT round, id, white_id, black_id, winner_id, status, is_tiebreak FROM tournament_matches WHERE tournament_id=? ORDER BY round, id", (t_id,))
     if not rows:
         return "No matches yet."
     out = []
@@ -898,7 +3015,9 @@ def _bracket_text(t_id: int) -> str:
             out.append(f"Round {rnd}:")
         tag = " (TB)" if tb else ""
         vs = f"<@{w}> vs <@{b}>{tag}" if b is not None else f"<@{w}> gets a bye"
-        if st == 'done':
+        if st == 'done' and win is None:
+            line = f"  Match #{mid}: {vs} — Draw"
+        elif st == 'done':
             line = f"  Match #{mid}: {vs} — Winner: <@{win}>"
         else:
             line = f"  Match #{mid}: {vs} — {st.title()}"
@@ -907,83 +3026,91 @@ def _bracket_text(t_id: int) -> str:
 
 @bot.command(name='tournament_create')
 async def tournament_create(ctx, *, name: str):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("INSERT INTO tournaments(guild_id, name, status, created_at) VALUES (?, ?, 'created', ?)", (ctx.guild.id if ctx.guild else 0, name, datetime.datetime.utcnow().isoformat()))
-    t_id = c.lastrowid
-    conn.commit()
-    conn.close()
+    t_id = await db.execute("INSERT INTO tournaments(guild_id, name, status, created_at) VALUES (?, ?, 'created', ?)", (ctx.guild.id if ctx.guild else 0, name, datetime.datetime.utcnow().isoformat()))
     await ctx.send(f"Tournament created: #{t_id} — {name}. Players can join with `/tournament_join {t_id}`")
 
+@bot.command(name='tournament_create_swiss')
+async def tournament_create_swiss(ctx, rounds: int, *, name: str):
+    if not 1 <= rounds <= 30:
+        await ctx.send("A Swiss tournament needs between 1 and 30 rounds.")
+        return
+    t_id = await db.execute("INSERT INTO tournaments(guild_id, name, status, created_at, format, rounds) VALUES (?, ?, 'created', ?, 'swiss', ?)", (ctx.guild.id if ctx.guild else 0, name, datetime.datetime.utcnow().isoformat(), rounds))
+    await ctx.send(f"Swiss tournament created: #{t_id} — {name} ({rounds} rounds). Players can join with `/tournament_join {t_id}`")
+
 @bot.command(name='tournament_join')
 async def tournament_join(ctx, tournament_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    # Ensure tournament exists and not started
-    c.execute("SELECT status FROM tournaments WHERE id=?", (tournament_id,))
-    row = c.fetchone()
-    if not row:
-        conn.close()
-        await ctx.send("Tournament not found.")
-        return
-    if row[0] != 'created':
-        conn.close()
-        await ctx.send("Tournament already started or finished.")
-        return
-    # Add player if not already added
-    c.execute("SELECT 1 FROM tournament_players WHERE tournament_id=? AND user_id=?", (tournament_id, ctx.author.id))
-    exists = c.fetchone()
-    if not exists:
-        c.execute("INSERT INTO tournament_players(tournament_id, user_id) VALUES (?, ?)", (tournament_id, ctx.author.id))
-        conn.commit()
-        await ctx.send(f"You have joined tournament #{tournament_id}.")
-    else:
-        await ctx.send("You are already registered in this tournament.")
-    conn.close()
+    def _join(conn, user_id):
+        c = conn.cursor()
+        # Ensure tournament exists and not started
+        c.execute("SELECT status FROM tournaments WHERE id=?", (tournament_id,))
+        row = c.fetchone()
+        if not row:
+            return "Tournament not found."
+        if row[0] != 'created':
+            return "Tournament already started or finished."
+        # Add player if not already added
+        c.execute("SELECT 1 FROM tournament_players WHERE tournament_id=? AND user_id=?", (tournament_id, user_id))
+        exists = c.fetchone()
+        if not exists:
+            c.execute("INSERT INTO tournament_players(tournament_id, user_id) VALUES (?, ?)", (tournament_id, user_id))
+            return f"You have joined tournament #{tournament_id}."
+        return "You are already registered in this tournament."
+    await ctx.send(await db.write(_join, ctx.author.id))
 
 @bot.command(name='tournament_start')
 async def tournament_start(ctx, tournament_id: int):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT status FROM tournaments WHERE id=?", (tournament_id,))
-    row = c.fetchone()
-    if not row:
-        conn.close()
-        await ctx.send("Tournament not found.")
-        return
-    if row[0] != 'created':
-        conn.close()
-        await ctx.send("Tournament already started or finished.")
-        return
-    # Get players (need at least 2)
-    c.execute("SELECT user_id FROM tournament_players WHERE tournament_id=?", (tournament_id,))
-    players = [r[0] for r in c.fetchall()]
-    if len(players) < 2:
-        conn.close()
-        await ctx.send("Need at least 2 players to start.")
+    def _start(conn):
+        c = conn.cursor()
+        c.execute("SELECT status FROM tournaments WHERE id=?", (tournament_id,))
+        row = c.fetchone()
+        if not row:
+            return "Tournament not found.", None
+        if row[0] != 'created':
+            return "Tournament already started or finished.", None
+        # Get players (need at least 2)
+        c.execute("SELECT user_id FROM tournament_players WHERE tournament_id=?", (tournament_id,))
+        players = [r[0] for r in c.fetchall()]
+        if len(players) < 2:
+            return "Need at least 2 players to start.", None
+        # Create round 1 matches
+        c.execute("SELECT format FROM tournaments WHERE id=?", (tournament_id,))
+        if c.fetchone()[0] == 'swiss':
+            matches = _create_swiss_round_tx(c, tournament_id, 1)
+        else:
+            matches = _create_round_tx(c, tournament_id, 1, players)
+        c.execute("UPDATE tournaments SET status='ongoing' WHERE id=?", (tournament_id,))
+        return None, matches
+    error, matches = await db.write(_start)
+    if error:
+        await ctx.send(error)
         return
-    # Create round 1 matches
-    _create_matches_for_round(tournament_id, 1, players)
-    c.execute("UPDATE tournaments SET status='ongoing' WHERE id=?", (tournament_id,))
-    conn.commit()
-    conn.close()
     await ctx.send(f"Tournament #{tournament_id} started. Generating Round 1 matches...")
-    _start_pending_matches_in_round(ctx, tournament_id, 1)
+    await _start_round_games(ctx, tournament_id, 1, matches)
 
 @bot.command(name='tournament_bracket')
 async def tournament_bracket(ctx, tournament_id: int):
-    txt = _bracket_text(tournament_id)
+    txt = await _bracket_text(tournament_id)
     await ctx.send(f"Bracket for Tournament #{tournament_id}:\n{txt}")
 
+@bot.command(name='botstats')
+@commands.check_any(commands.is_owner(), commands.has_permissions(administrator=True))
+async def botstats(ctx):
+    # Fence each chunk on its own; merged sends never split inside one
+    fence = "```\n{}\n```"
+    for chunk in split_message(metrics.report(), MESSAGE_LIMIT - len(fence.format(""))):
+        await ctx.send(fence.format(chunk))
+
 # Command to exit the game
 @bot.command(name='exit', aliases=['quit', 'q'])
 async def exit_game(ctx):
     # Check if the user is in a game and clear the game state
     if ctx.author.id in games:
-        opponent_id = games[ctx.author.id]['opponent']
-        games.pop(ctx.author.id, None)
-        games.pop(opponent_id, None)
+        _end_game(await games.fetch(ctx.author.id))
 
+        await ctx.send("Game has been exited. All game state has been cleared."
+                       )
+    elif _session_key(ctx) in sessions:
+        _end_session(ctx, sessions[_session_key(ctx)])
         await ctx.send("Game has been exited. All game state has been cleared."
                        )
     else:
@@ -1027,6 +3154,6 @@ async def exit_game(ctx):
 async def on_ready():
     print(f'Logged in as {bot.user} (ID: {bot.user.id})')
     print('------')
-    # Initialize persistence
-    init_db()
-bot.run(TOKEN)
+
+if __name__ == "__main__":
+    bot.run(TOKEN)